@@ -0,0 +1,84 @@
+"""Benchmark: food log snapshot save/load time and size, stdlib json vs the binary format
+
+Generates a log of the given sizes, writes it with each FOOD_LOG_FORMATS entry
+(the same atomic write the app does) and reads it back, checking the round trip.
+The json row is what the app did before, the whole list as one JSON document.
+
+    python bench_food_log_format.py [--sizes 10000 100000 1000000] [--runs 3]
+"""
+import argparse
+import gc
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from python import FOOD_LOG_FORMATS, read_food_log_snapshot
+
+FOODS = ["chicken breast", "white rice", "broccoli", "oatmeal", "banana", "greek yogurt",
+         "salmon", "eggs", "peanut butter", "whole wheat bread", "apple", "almonds"]
+MEALS = ["Breakfast", "Lunch"]
+
+
+def make_log(count):
+    rng = random.Random(42)
+    start = datetime(2020, 1, 1)
+    photos = [{"thumb": f"https://nix-tag-images.s3.amazonaws.com/{i}_thumb.jpg", "highres": None, "is_user_uploaded": False}
+              for i in range(len(FOODS))]
+    entries = []
+    for i in range(count):
+        food = rng.randrange(len(FOODS))
+        entries.append({
+            'food': FOODS[food],
+            'quantity': float(rng.choice([50, 100, 150, 200, 250])),
+            'meal': rng.choice(MEALS),
+            'notes': "",
+            'calories': rng.randint(50, 700),
+            'protein': rng.randint(0, 60),
+            'carbs': rng.randint(0, 90),
+            'fats': rng.randint(0, 40),
+            'date': (start + timedelta(days=i // 10)).strftime("%Y-%m-%d"),
+            'id': str(1_700_000_000_000_000 + i),
+            'photo': dict(photos[food])
+        })
+    return entries
+
+
+def timed(fn, runs):
+    timings = []
+    result = None
+    for _ in range(runs):
+        result = None
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    print(f"median of {args.runs} runs")
+    for size in args.sizes:
+        entries = make_log(size)
+        print(f"{size} entries")
+        for fmt in FOOD_LOG_FORMATS.values():
+            path = os.path.join(workdir, "food_log" + fmt.extension)
+            _, save_ms = timed(lambda: fmt.write(path, entries), args.runs)
+            loaded, load_ms = timed(lambda: read_food_log_snapshot(path), args.runs)
+            ok = "ok" if loaded == entries else "MISMATCH"
+            print(f"{fmt.name:>10}: save {save_ms:8.1f} ms  load {load_ms:8.1f} ms  size {os.path.getsize(path) / 1e6:7.2f} MB  round trip {ok}")
+            loaded = None
+            os.remove(path)
+        entries = None
+
+
+if __name__ == "__main__":
+    main()
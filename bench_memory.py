@@ -0,0 +1,87 @@
+"""Benchmark: memory per food log entry, plain dicts vs compact FoodEntry objects
+
+Builds a food log the way it sits on disk (one JSON list, every entry with its
+own photo dict), then measures with tracemalloc what the parsed dicts take
+versus the same entries held as FoodEntry objects in a FoodLogIndex. Also
+checks that every entry converts back to exactly the dict it came from.
+
+    python bench_memory.py [--entries 100000]
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from python import EntryColumns, FoodEntry, FoodLogIndex
+
+FOODS = ["chicken breast", "white rice", "broccoli", "oatmeal", "banana", "greek yogurt",
+         "salmon", "eggs", "peanut butter", "whole wheat bread", "apple", "almonds"]
+
+
+def make_log_json(count):
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    entries = []
+    for i in range(count):
+        food = rng.choice(FOODS)
+        entries.append({
+            'food': food,
+            'quantity': float(rng.choice([50, 100, 150, 200, 250])),
+            'meal': rng.choice(["Breakfast", "Lunch"]),
+            'notes': "",
+            'calories': rng.randint(50, 700),
+            'protein': rng.randint(0, 60),
+            'carbs': rng.randint(0, 90),
+            'fats': rng.randint(0, 40),
+            'date': (start + timedelta(days=i // 10)).strftime("%Y-%m-%d"),
+            'id': str(1_700_000_000_000_000 + i),
+            'photo': {"thumb": f"https://nix-tag-images.s3.amazonaws.com/{FOODS.index(food)}_thumb.jpg",
+                      "highres": None, "is_user_uploaded": False}
+        })
+    return json.dumps(entries)
+
+
+def measure(build):
+    # Timed on its own first, tracemalloc slows every allocation down
+    gc.collect()
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100_000)
+    args = parser.parse_args()
+
+    raw = make_log_json(args.entries)
+
+    dicts, dict_bytes, dict_time = measure(lambda: json.loads(raw))
+
+    def build_compact():
+        columns = EntryColumns()
+        return [FoodEntry.from_dict(entry, columns) for entry in json.loads(raw)]
+
+    compact, compact_bytes, compact_time = measure(build_compact)
+    index, index_bytes, index_time = measure(lambda: FoodLogIndex(json.loads(raw)))
+
+    mismatches = sum(1 for original, entry in zip(dicts, compact) if dict(entry) != original)
+    print(f"{args.entries} entries")
+    print(f"{'plain dicts':>22}: {dict_bytes / 1e6:8.1f} MB  {dict_bytes / args.entries:6.0f} B/entry  load {dict_time * 1000:6.0f} ms")
+    print(f"{'FoodEntry objects':>22}: {compact_bytes / 1e6:8.1f} MB  {compact_bytes / args.entries:6.0f} B/entry  load {compact_time * 1000:6.0f} ms")
+    print(f"{'FoodLogIndex':>22}: {index_bytes / 1e6:8.1f} MB  {index_bytes / args.entries:6.0f} B/entry  load {index_time * 1000:6.0f} ms")
+    print(f"round-trip mismatches: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Benchmark: bare requests calls vs the pooled NutritionixClient session
+
+Runs a local stand-in for trackapi.nutritionix.com and times the same calls
+both ways. Use --tls to serve HTTPS with a throwaway self-signed cert (needs
+the openssl CLI), which is closer to the real handshake cost.
+
+    python bench_nutritionix.py [--calls 200] [--tls]
+"""
+import argparse
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import urllib3
+
+from python import NutritionixClient
+
+SEARCH_BODY = json.dumps({"common": [{"food_name": "chicken breast", "photo": {"thumb": ""}}] * 10}).encode()
+NUTRIENTS_BODY = json.dumps({"foods": [{"nf_calories": 165, "nf_protein": 31, "nf_total_carbohydrate": 0, "nf_total_fat": 3.6}]}).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so the server honours keep-alive
+    protocol_version = "HTTP/1.1"
+    # Otherwise Nagle + delayed ACK stalls every reply on a reused connection
+    disable_nagle_algorithm = True
+
+    def _reply(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(SEARCH_BODY)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply(NUTRIENTS_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(tls):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    scheme = "http"
+    if tls:
+        cert_dir = tempfile.mkdtemp()
+        cert, key = os.path.join(cert_dir, "cert.pem"), os.path.join(cert_dir, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+             "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+            check=True, capture_output=True
+        )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}"
+
+
+def time_calls(calls, fn):
+    timings = []
+    for i in range(calls):
+        start = time.perf_counter()
+        response = fn(i)
+        response.raise_for_status()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--tls", action="store_true")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore", urllib3.exceptions.InsecureRequestWarning)
+    server, base_url = start_server(args.tls)
+    headers = {"x-app-id": "bench", "x-app-key": "bench", "x-remote-user-id": "0"}
+
+    def bare(i):
+        # What the app used to do: a fresh connection for every call
+        if i % 2:
+            return requests.get(f"{base_url}/v2/search/instant?query=chicken", headers=headers, verify=False)
+        return requests.post(f"{base_url}/v2/natural/nutrients", headers=headers, json={"query": "100g chicken"}, verify=False)
+
+    client = NutritionixClient("bench", "bench", base_url=base_url)
+    client.session.verify = False
+    # Stop REQUESTS_CA_BUNDLE from overriding verify=False
+    client.session.trust_env = False
+
+    def pooled(i):
+        if i % 2:
+            return client.search_instant("chicken")
+        return client.natural_nutrients("100g chicken")
+
+    results = {}
+    for name, fn in (("bare requests", bare), ("pooled session", pooled)):
+        time_calls(5, fn)  # warm up
+        results[name] = time_calls(args.calls, fn)
+
+    print(f"{args.calls} calls against {base_url}")
+    for name, timings in results.items():
+        print(f"{name:>15}: mean {statistics.mean(timings):7.3f} ms  median {statistics.median(timings):7.3f} ms  p95 {sorted(timings)[int(len(timings) * 0.95)]:7.3f} ms")
+    saved = statistics.mean(results["bare requests"]) - statistics.mean(results["pooled session"])
+    print(f"saved per call: {saved:.3f} ms")
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark: cold-start cost of python.py
+
+Each measurement runs in a fresh interpreter so nothing is already imported.
+Reports the time to import python.py, the import cost of the modules it now
+loads lazily (what startup used to pay up front), and the time from process
+start until the main window has painted and the Tk loop is idle. The last one
+needs a display and is skipped without one.
+
+    python bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_APP = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {here!r})
+import python
+print(time.perf_counter() - start)
+"""
+
+IMPORT_DEFERRED = """
+import importlib, time
+start = time.perf_counter()
+for name in ("google.generativeai", "aiohttp"):
+    importlib.import_module(name)
+print(time.perf_counter() - start)
+"""
+
+TIME_TO_INTERACTIVE = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {here!r})
+import python
+app = python.AZFoodLogger()
+painted = []
+app.window.after_idle(lambda: painted.append(time.perf_counter() - start))
+while not painted:
+    app.window.update()
+print(painted[0])
+app.window.destroy()
+app.scheduler.shutdown()
+app.async_bridge.shutdown()
+"""
+
+
+def run_child(code, cwd):
+    result = subprocess.run(
+        [sys.executable, "-c", code.format(here=HERE)],
+        cwd=cwd, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "child failed")
+    return float(result.stdout.strip().splitlines()[-1]) * 1000
+
+
+def measure(name, code, runs, cwd):
+    try:
+        timings = [run_child(code, cwd) for _ in range(runs)]
+    except RuntimeError as e:
+        print(f"{name:>28}: skipped ({e})")
+        return
+    print(f"{name:>28}: median {statistics.median(timings):8.1f} ms  min {min(timings):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    # A throwaway working directory with a profile, so the app goes straight to the main window
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, "user_profile.json"), "w") as f:
+        json.dump({"weight": 80, "height": 180, "goal": "general fitness"}, f)
+
+    print(f"{args.runs} cold starts each")
+    measure("import python.py", IMPORT_APP, args.runs, workdir)
+    measure("deferred imports (lazy)", IMPORT_DEFERRED, args.runs, workdir)
+    measure("time to interactive", TIME_TO_INTERACTIVE, args.runs, workdir)
+
+
+if __name__ == "__main__":
+    main()
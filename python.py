@@ -1,17 +1,30 @@
 import json
 import time
+import asyncio
+import inspect
 from datetime import datetime
 import customtkinter as ctk
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 import os
-import google.generativeai as genai
-import pandas as pd
+import sqlite3
+import hashlib
+import gzip
+import math
+import re
+import sys
+import struct
+import importlib
+import atexit
+from functools import lru_cache
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import threading
 from queue import Queue, Empty
+from collections import OrderedDict, Counter
+from collections.abc import MutableMapping
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageTk
 from io import BytesIO
 
@@ -19,8 +32,2415 @@ load_dotenv()
 NUTRITIONIX_APP_ID = os.getenv('NUTRITIONIX_APP_ID')
 NUTRITIONIX_API_KEY = os.getenv('NUTRITIONIX_API_KEY')
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
+# "json" (snapshot plus journal, see FOOD_LOG_FORMAT) or "sqlite" (food_log.db)
+FOOD_LOG_ENGINE = os.getenv('FOOD_LOG_ENGINE', 'json')
+# Snapshot format for the json engine: "binary" (columnar food_log.bin) or "json" (food_log.json).
+# An existing snapshot in the other format is picked up and converted on the next start.
+FOOD_LOG_FORMAT = os.getenv('FOOD_LOG_FORMAT', 'binary')
+# Entries from the last this many days stay in memory, older ones move to monthly archives
+FOOD_LOG_HOT_DAYS = int(os.getenv('FOOD_LOG_HOT_DAYS', '31'))
+# AI coach answer cache: how alike a question must be to reuse an answer (0-1), and how long answers stay fresh
+COACH_CACHE_THRESHOLD = float(os.getenv('COACH_CACHE_THRESHOLD', '0.8'))
+COACH_CACHE_MAX_AGE_DAYS = float(os.getenv('COACH_CACHE_MAX_AGE_DAYS', '14'))
+# A coach question asked within this many minutes of the last answer (same launch) may be a follow-up
+COACH_FOLLOWUP_MINUTES = float(os.getenv('COACH_FOLLOWUP_MINUTES', '30'))
+# Bump whenever WORKOUT_PROMPT_TEMPLATE changes so cached plans from the old prompt are not reused
+WORKOUT_PROMPT_VERSION = 1
+WORKOUT_PROMPT_TEMPLATE = """Create a detailed 5-day bodybuilding workout plan:
+
+Overview:
+- Rest days and schedule
+- Progression guidelines
+- Cardio recommendations
+- Nutrition tips
+- General guidelines
+
+For each day (Days 1-5), provide:
+Day [X]: [Focus]
+- Detailed exercise list with sets, reps, and rest periods
+- Form cues and tips
+- Progression suggestions
+
+User stats:
+- Weight: {weight}kg
+- Height: {height}cm
+- Goal: {goal}
+- Experience: {experience}
+
+Please provide a comprehensive and detailed plan with clear formatting."""
+
+@lru_cache(maxsize=None)
+def lazy_import(name, optional=False):
+    """Import a heavy module on first use instead of at startup, None if optional and not installed"""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        if optional:
+            return None
+        raise
+
+def atomic_write_json(path, data):
+    """Write data as JSON through a temp file, fsync and rename, so a crash never leaves a partial file"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def atomic_write_bytes(path, payload):
+    """atomic_write_json for data that is already encoded"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def save_json(path, data, writer=None):
+    """atomic_write_json, done behind the UI by writer (a PersistenceWorker) when there is one"""
+    if writer is not None:
+        writer.write_json(path, data)
+    else:
+        atomic_write_json(path, data)
+
+class PersistenceWorker:
+    """Background thread that does the app's file writes, coalescing bursts into one flush
+
+    The first request after a flush starts a short delay; everything requested
+    meanwhile is written together. Only the newest data for a path is written,
+    and journal lines for a path are appended with a single write and fsync.
+    Jobs queued with call() run after the lines requested before them and
+    before the lines requested after. Callers hand over data they no longer mutate.
+    """
+
+    def __init__(self, delay=0.25):
+        self.delay = delay
+        self._cond = threading.Condition()
+        # path -> (data, write, callback), or None to delete the file
+        self._writes = OrderedDict()
+        # path -> [lines] to append
+        self._appends = OrderedDict()
+        # (appends requested before the job, job) in request order
+        self._jobs = []
+        self._dirty_since = None
+        self._closed = False
+        # Flushes from the worker and from flush() callers take turns
+        self._flush_lock = threading.Lock()
+        self.requests = 0
+        self.flushes = 0
+        self._thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+        self._thread.start()
+
+    def _mark_dirty(self):
+        self.requests += 1
+        if self._dirty_since is None:
+            self._dirty_since = time.monotonic()
+            self._cond.notify()
+
+    def write_json(self, path, data, callback=None):
+        """Atomically replace path with data soon, then call callback() on the worker thread"""
+        self.write_file(path, data, atomic_write_json, callback)
+
+    def write_file(self, path, data, write, callback=None):
+        """Like write_json, with write(path, data) doing the actual atomic write"""
+        with self._cond:
+            self._writes[path] = (data, write, callback)
+            self._writes.move_to_end(path)
+            self._mark_dirty()
+
+    def remove(self, path):
+        with self._cond:
+            self._writes[path] = None
+            self._writes.move_to_end(path)
+            self._mark_dirty()
+
+    def append_line(self, path, line):
+        with self._cond:
+            self._appends.setdefault(path, []).append(line)
+            self._mark_dirty()
+
+    def call(self, job):
+        """Run job() on the worker between the lines appended before and after this call"""
+        with self._cond:
+            self._jobs.append((self._appends, job))
+            self._appends = OrderedDict()
+            self._mark_dirty()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._dirty_since is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # Let the burst settle before writing
+                remaining = self._dirty_since + self.delay - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+            self.flush()
+
+    def flush(self):
+        """Write everything requested so far, on the calling thread"""
+        with self._flush_lock:
+            with self._cond:
+                writes, self._writes = self._writes, OrderedDict()
+                appends, self._appends = self._appends, OrderedDict()
+                jobs, self._jobs = self._jobs, []
+                self._dirty_since = None
+            if not writes and not appends and not jobs:
+                return
+            self.flushes += 1
+            for before, job in jobs:
+                self._append_all(before)
+                try:
+                    job()
+                except Exception as e:
+                    print(f"7asal error fel background job: {str(e)}")  # Egyptian Franko
+            self._append_all(appends)
+            for path, op in writes.items():
+                try:
+                    if op is None:
+                        if os.path.exists(path):
+                            os.remove(path)
+                        continue
+                    data, write, callback = op
+                    write(path, data)
+                    if callback is not None:
+                        callback()
+                except Exception as e:
+                    print(f"7asal error fel saving bta3 {path}: {str(e)}")  # Egyptian Franko
+
+    def _append_all(self, appends):
+        for path, lines in appends.items():
+            try:
+                with open(path, "a") as f:
+                    f.write("".join(lines))
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                print(f"7asal error fel append le {path}: {str(e)}")  # Egyptian Franko
+
+    def close(self):
+        """Stop the worker and write whatever is still pending, safe to call more than once"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=5)
+        self.flush()
+
+def days_ago(days):
+    """YYYY-MM-DD date for days before today"""
+    return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+class NutrientCache:
+    """Disk-backed per-gram nutrient vectors keyed by normalized food name, with TTL and LRU eviction"""
+
+    def __init__(self, path="nutrient_cache.json", ttl=30 * 24 * 3600, max_entries=1000, writer=None):
+        self.path = path
+        self.writer = writer
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # name -> {"per_gram": {...}, "fetched": timestamp}, least recently used first
+        self._entries = OrderedDict()
+        try:
+            with open(path, "r") as f:
+                for name, record in json.load(f):
+                    self._entries[name] = record
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, ValueError, TypeError) as e:
+            print(f"Ignoring unreadable nutrient cache: {str(e)}")
+
+    @staticmethod
+    def normalize(food_name):
+        return " ".join(str(food_name).lower().split())
+
+    def get(self, food_name):
+        key = self.normalize(food_name)
+        with self._lock:
+            record = self._entries.get(key)
+            if record is None:
+                return None
+            if time.time() - record['fetched'] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return record['per_gram']
+
+    def put(self, food_name, per_gram, save=True):
+        with self._lock:
+            key = self.normalize(food_name)
+            self._entries[key] = {"per_gram": per_gram, "fetched": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if save:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            records = list(self._entries.items())
+        try:
+            save_json(self.path, records, self.writer)
+        except OSError as e:
+            print(f"7asal error fel saving bta3 el nutrient cache: {str(e)}")
+
+class SearchCache:
+    """In-memory LRU + TTL cache of /v2/search/instant responses keyed by normalized query"""
+
+    # Instant search returns at most this many items per section, a full section may be missing matches
+    PAGE_SIZE = 20
+    # Shorter prefixes match too much to be worth filtering
+    MIN_PREFIX = 3
+
+    def __init__(self, ttl=3600, max_entries=200):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # query -> (fetched timestamp, response dict), least recently used first
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def normalize(query):
+        return " ".join(str(query).lower().split())
+
+    def _fresh(self, key):
+        cached = self._entries.get(key)
+        if cached is None:
+            return None
+        if time.time() - cached[0] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return cached[1]
+
+    def get(self, query):
+        """Cached results for query, or results filtered from a cached shorter prefix of it"""
+        key = self.normalize(query)
+        with self._lock:
+            results = self._fresh(key)
+            if results is not None:
+                return results
+            # Longest cached prefix first, "chicken b" -> "chicken" -> "chick" ...
+            for end in range(len(key) - 1, self.MIN_PREFIX - 1, -1):
+                prefix_results = self._fresh(key[:end])
+                if prefix_results is None:
+                    continue
+                if self._truncated(prefix_results):
+                    # The server cut this list short, filtering it would drop matches it has
+                    return None
+                filtered = self._filter(prefix_results, key)
+                if filtered is not None:
+                    # Remember it under the longer query too, expiring with the prefix it came from
+                    self._entries[key] = (self._entries[key[:end]][0], filtered)
+                    return filtered
+                # Nothing in the prefix results matches, the server may know more
+                return None
+        return None
+
+    def _truncated(self, results):
+        return any(isinstance(items, list) and len(items) >= self.PAGE_SIZE for items in results.values())
+
+    def _filter(self, results, key):
+        terms = key.split()
+        filtered = {}
+        for section, items in results.items():
+            if not isinstance(items, list):
+                continue
+            filtered[section] = [
+                item for item in items
+                if all(term in self.normalize(item.get('food_name', '')) for term in terms)
+            ]
+        if not filtered.get('common'):
+            return None
+        return filtered
+
+    def put(self, query, results):
+        with self._lock:
+            key = self.normalize(query)
+            self._entries[key] = (time.time(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class ProfileStore:
+    """user_profile.json read once and served from memory, reloaded when its mtime changes
+
+    Subscribers are called on the thread that noticed the change, with the
+    fields whose values changed, and only if one of the fields they asked for did.
+    """
+
+    def __init__(self, path="user_profile.json", writer=None):
+        self.path = path
+        self.writer = writer
+        self._lock = threading.Lock()
+        self._profile = None
+        # (mtime_ns, size) of the file the profile was read from
+        self._stamp = None
+        self._subscribers = []
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read(self):
+        stamp = self._file_stamp()
+        if stamp is None:
+            return {}, None
+        with open(self.path, "r") as f:
+            return json.load(f), stamp
+
+    def get(self):
+        """Copy of the profile, {} if there is none yet; raises json.JSONDecodeError on a corrupt file"""
+        with self._lock:
+            if self._profile is None:
+                self._profile, self._stamp = self._read()
+            return dict(self._profile)
+
+    def check(self):
+        """Reload if the file changed on disk since we last read or wrote it, returns the changed fields"""
+        stamp = self._file_stamp()
+        with self._lock:
+            if self._profile is not None and stamp == self._stamp:
+                return {}
+        try:
+            profile, stamp = self._read()
+        except (OSError, json.JSONDecodeError) as e:
+            # Probably caught mid-write, the next check picks it up
+            print(f"Skipping profile reload: {str(e)}")
+            return {}
+        return self._replace(profile, stamp)
+
+    def save(self, profile):
+        profile = dict(profile)
+        if self.writer is None:
+            atomic_write_json(self.path, profile)
+            return self._replace(profile, self._file_stamp())
+        
+        def written():
+            # Our own write shouldn't look like an outside edit to check()
+            with self._lock:
+                if self._profile == profile:
+                    self._stamp = self._file_stamp()
+        self.writer.write_json(self.path, profile, callback=written)
+        return self._replace(profile, self._stamp)
+
+    def _replace(self, profile, stamp):
+        with self._lock:
+            old = self._profile or {}
+            self._profile, self._stamp = profile, stamp
+            subscribers = list(self._subscribers)
+        changed = {key: profile.get(key) for key in set(old) | set(profile) if old.get(key) != profile.get(key)}
+        if changed:
+            for callback, fields in subscribers:
+                if fields is None or fields & changed.keys():
+                    try:
+                        callback(changed)
+                    except Exception as e:
+                        print(f"Error in profile subscriber: {str(e)}")
+        return changed
+
+    def subscribe(self, callback, fields=None):
+        """Call callback(changed) when any of fields (default: any field) changes value"""
+        self._subscribers.append((callback, set(fields) if fields is not None else None))
+
+class WorkoutPlanCache:
+    """Generated workout plans on disk, one file per hash of prompt version + user stats, LRU by mtime"""
+
+    def __init__(self, directory="workout_plan_cache", max_entries=20, writer=None):
+        self.directory = directory
+        self.writer = writer
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> last used timestamp, least recently used first
+        self._entries = OrderedDict()
+        try:
+            names = [name for name in os.listdir(directory) if name.endswith(".json")]
+        except FileNotFoundError:
+            names = []
+        paths = sorted((os.path.getmtime(os.path.join(directory, name)), name) for name in names)
+        for used, name in paths:
+            self._entries[name[:-len(".json")]] = used
+
+    @staticmethod
+    def key_for(user_stats, version=None):
+        """Content address of a plan: what went into the prompt, not when it was asked for"""
+        material = json.dumps({
+            "version": WORKOUT_PROMPT_VERSION if version is None else version,
+            "stats": user_stats
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            try:
+                with open(self._path(key), "r") as f:
+                    plan = json.load(f)['plan']
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Dropping unreadable cached plan {key}: {str(e)}")
+                del self._entries[key]
+                return None
+            self._entries[key] = time.time()
+            self._entries.move_to_end(key)
+            try:
+                # mtime doubles as the LRU clock across restarts
+                os.utime(self._path(key))
+            except OSError:
+                pass
+            return plan
+
+    def put(self, key, plan, user_stats=None):
+        with self._lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                save_json(self._path(key), {"plan": plan, "stats": user_stats, "created": time.time()}, self.writer)
+            except OSError as e:
+                print(f"7asal error fel saving bta3 el workout plan cache: {str(e)}")
+                return
+            self._entries[key] = time.time()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                if self.writer is not None:
+                    # Queued behind its own write, if that hasn't happened yet
+                    self.writer.remove(self._path(evicted))
+                    continue
+                try:
+                    os.remove(self._path(evicted))
+                except OSError:
+                    pass
+
+class CoachAnswerCache:
+    """Disk-backed AI coach answers, matched to near-duplicate questions by character trigram TF-IDF cosine
+
+    Trigram similarity alone happily matches "gain weight" with "lose weight"
+    or "300g" with "100g", so a match must also have the same numbers, no
+    opposite words, the same negation and enough content words in common.
+    """
+
+    STOPWORDS = frozenset(
+        "a an the i me my we you your is are am be do does did can could should would will to of for in on at "
+        "and or it this that with how what when which much many there some any per".split()
+    )
+    NEGATIONS = frozenset(["not", "no", "never", "dont", "don", "without", "avoid"])
+    # Either word of a pair in one question and the other word in the other question means they ask different things
+    OPPOSITES = [
+        ("gain", "lose"), ("gain", "loss"), ("bulk", "cut"), ("bulking", "cutting"), ("increase", "decrease"),
+        ("more", "less"), ("high", "low"), ("before", "after"), ("morning", "night"), ("build", "burn"),
+        ("add", "remove"), ("up", "down"), ("max", "min"), ("maximum", "minimum"), ("fat", "lean")
+    ]
+    # Jaccard overlap of content words a match needs on top of the trigram threshold
+    min_word_overlap = 0.6
+
+    def __init__(self, path="coach_answer_cache.json", threshold=0.8, max_age=14 * 24 * 3600, max_entries=500, writer=None):
+        self.path = path
+        self.writer = writer
+        self.threshold = threshold
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # normalized question -> {"answer", "created", "latency"}, least recently used first
+        self._entries = OrderedDict()
+        # Similarity index: trigram counts per question, document frequency, trigram -> questions
+        self._grams = {}
+        self._df = Counter()
+        self._postings = {}
+        self.stats = {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            for question, record in data.get("entries", []):
+                self._add(question, record)
+            self.stats.update(data.get("stats", {}))
+            self._drop_stale()
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, ValueError, TypeError, AttributeError) as e:
+            print(f"Ignoring unreadable coach answer cache: {str(e)}")
+
+    @staticmethod
+    def normalize(question):
+        return " ".join(re.sub(r"[^a-z0-9 ]+", " ", str(question).lower()).split())
+
+    @staticmethod
+    def _trigrams(text):
+        padded = f" {text} "
+        return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+    def _add(self, question, record):
+        if question in self._entries:
+            self._remove(question)
+        grams = self._trigrams(question)
+        self._entries[question] = record
+        self._grams[question] = grams
+        self._df.update(grams.keys())
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(question)
+
+    def _remove(self, question):
+        del self._entries[question]
+        for gram in self._grams.pop(question):
+            self._df[gram] -= 1
+            if not self._df[gram]:
+                del self._df[gram]
+            self._postings[gram].discard(question)
+            if not self._postings[gram]:
+                del self._postings[gram]
+
+    @classmethod
+    def _content_words(cls, text):
+        return {word for word in text.split() if word not in cls.STOPWORDS and not any(ch.isdigit() for ch in word)}
+
+    @classmethod
+    def compatible(cls, question, other):
+        """False when two normalized questions that look alike can't share an answer"""
+        if sorted(re.findall(r"\d+", question)) != sorted(re.findall(r"\d+", other)):
+            return False
+        words, other_words = set(question.split()), set(other.split())
+        if bool(words & cls.NEGATIONS) != bool(other_words & cls.NEGATIONS):
+            return False
+        for first, second in cls.OPPOSITES:
+            if (first in words and second in other_words) or (second in words and first in other_words):
+                return False
+        content, other_content = cls._content_words(question), cls._content_words(other)
+        if not content and not other_content:
+            return True
+        return len(content & other_content) / len(content | other_content) >= cls.min_word_overlap
+
+    def _stale(self, record, now):
+        return now - record['created'] > self.max_age
+
+    def _drop_stale(self):
+        """Full sweep for expired answers, lookups only drop the ones they come across"""
+        now = time.time()
+        for question in [q for q, record in self._entries.items() if self._stale(record, now)]:
+            self._remove(question)
+
+    def _idf(self, gram):
+        return math.log((1 + len(self._entries)) / (1 + self._df.get(gram, 0))) + 1
+
+    def _similarity(self, grams, question):
+        other = self._grams[question]
+        dot = sum(count * other[gram] * self._idf(gram) ** 2 for gram, count in grams.items() if gram in other)
+        if not dot:
+            return 0.0
+        norm = math.sqrt(sum((count * self._idf(gram)) ** 2 for gram, count in grams.items()))
+        other_norm = math.sqrt(sum((count * self._idf(gram)) ** 2 for gram, count in other.items()))
+        return dot / (norm * other_norm)
+
+    def lookup(self, question):
+        """(answer, similarity) for the closest fresh cached question above the threshold, or None"""
+        key = self.normalize(question)
+        if not key:
+            return None
+        with self._lock:
+            now = time.time()
+            if key in self._entries and not self._stale(self._entries[key], now):
+                best, score = key, 1.0
+            else:
+                grams = self._trigrams(key)
+                candidates = set()
+                for gram in grams:
+                    candidates.update(self._postings.get(gram, ()))
+                # Expired answers are dropped as they come up, put() sweeps the rest
+                stale = [candidate for candidate in candidates if self._stale(self._entries[candidate], now)]
+                for candidate in stale:
+                    self._remove(candidate)
+                    candidates.discard(candidate)
+                best, score = None, 0.0
+                for candidate in candidates:
+                    similarity = self._similarity(grams, candidate)
+                    if similarity > score and similarity >= self.threshold and self.compatible(key, candidate):
+                        best, score = candidate, similarity
+            if best is None or score < self.threshold:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(best)
+            record = self._entries[best]
+            self.stats['hits'] += 1
+            self.stats['saved_seconds'] += record.get('latency', 0.0)
+            return record['answer'], score
+
+    def put(self, question, answer, latency=0.0):
+        key = self.normalize(question)
+        if not key or not answer:
+            return
+        with self._lock:
+            self._add(key, {"answer": answer, "created": time.time(), "latency": latency})
+            self._drop_stale()
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        self.save()
+
+    def hit_rate(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / lookups if lookups else 0.0
+
+    def report(self):
+        return (f"coach cache: {self.stats['hits']} hits / {self.stats['misses']} misses "
+                f"({self.hit_rate():.0%}), {self.stats['saved_seconds']:.1f}s of model latency saved")
+
+    def save(self):
+        with self._lock:
+            data = {"entries": list(self._entries.items()), "stats": dict(self.stats)}
+        try:
+            save_json(self.path, data, self.writer)
+        except OSError as e:
+            print(f"7asal error fel saving bta3 el coach cache: {str(e)}")
+
+class NutritionixClient:
+    """Nutritionix API client that reuses one pooled keep-alive session for every call"""
+
+    BASE_URL = "https://trackapi.nutritionix.com"
+
+    def __init__(self, app_id, api_key, base_url=None, pool_size=10, timeout=15, nutrient_cache=None, search_cache=None):
+        self.base_url = base_url or self.BASE_URL
+        self.timeout = timeout
+        self.nutrient_cache = nutrient_cache
+        self.search_cache = search_cache
+        self.session = requests.Session()
+        self.session.headers.update({
+            "x-app-id": app_id or "",
+            "x-app-key": api_key or "",
+            "x-remote-user-id": "0"
+        })
+        # One host, but several calls can be in flight from the worker threads
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def search_instant(self, query):
+        """GET /v2/search/instant"""
+        return self.session.get(
+            f"{self.base_url}/v2/search/instant",
+            params={"query": query},
+            timeout=self.timeout
+        )
+
+    def natural_nutrients(self, query):
+        """POST /v2/natural/nutrients"""
+        return self.session.post(
+            f"{self.base_url}/v2/natural/nutrients",
+            json={"query": query},
+            timeout=self.timeout
+        )
+
+    def search(self, query):
+        """Instant search results as a dict, answered from the search cache when possible
+
+        Raises requests.HTTPError on a failed call.
+        """
+        results = self.search_cache.get(query) if self.search_cache else None
+        if results is None:
+            response = self.search_instant(query)
+            response.raise_for_status()
+            results = response.json()
+            if self.search_cache:
+                self.search_cache.put(query, results)
+        return results
+
+    def get_nutrients(self, food_name, grams):
+        """Nutrients for grams of a food, scaled locally from the cached per-gram values
+
+        Returns the same nf_* fields as /v2/natural/nutrients, or None if the
+        food isn't recognised. Raises requests.HTTPError on a failed call.
+        """
+        per_gram = self.nutrient_cache.get(food_name) if self.nutrient_cache else None
+        if per_gram is None:
+            response = self.natural_nutrients(f"100g {food_name}")
+            response.raise_for_status()
+            foods = response.json().get('foods') or []
+            if not foods:
+                return None
+            per_gram = self._per_gram(foods[0])
+            if self.nutrient_cache:
+                self.nutrient_cache.put(food_name, per_gram)
+        return {key: value * grams for key, value in per_gram.items()}
+
+    def _per_gram(self, food_data):
+        weight = float(food_data.get('serving_weight_grams') or 100)
+        return {
+            key: value / weight for key, value in food_data.items()
+            if key.startswith('nf_') and isinstance(value, (int, float))
+        }
+
+    def get_nutrients_batch(self, items):
+        """Nutrients for several (food_name, grams) pairs with at most one API call
+
+        Cached foods are scaled locally, the rest go out together in a single
+        /v2/natural/nutrients query. Returns a list in the same order as items,
+        with None for foods that couldn't be resolved.
+        """
+        per_gram, missing = self._batch_cached(items)
+        if missing:
+            response = self.natural_nutrients(self._batch_query(missing))
+            response.raise_for_status()
+            self._batch_resolve(items, per_gram, missing, response.json().get('foods') or [])
+        return self._batch_scale(items, per_gram)
+
+    def _batch_cached(self, items):
+        """Cached per-gram vectors for items (None where missing), and the normalized names to look up"""
+        per_gram = [self.nutrient_cache.get(name) if self.nutrient_cache else None for name, grams in items]
+        missing = []
+        for i, (name, grams) in enumerate(items):
+            if per_gram[i] is None and NutrientCache.normalize(name) not in missing:
+                missing.append(NutrientCache.normalize(name))
+        return per_gram, missing
+
+    @staticmethod
+    def _batch_query(missing):
+        return ", ".join(f"100g {name}" for name in missing)
+
+    def _batch_resolve(self, items, per_gram, missing, foods):
+        """Fill per_gram in place from the foods a batch query returned, caching them"""
+        resolved = {}
+        if len(foods) == len(missing):
+            # The parser keeps the order of the query
+            resolved = dict(zip(missing, foods))
+        else:
+            # It merged or split something, fall back to matching names
+            for food_data in foods:
+                name = NutrientCache.normalize(food_data.get('food_name', ''))
+                if name in missing:
+                    resolved[name] = food_data
+        for name, food_data in resolved.items():
+            vector = self._per_gram(food_data)
+            if self.nutrient_cache:
+                self.nutrient_cache.put(name, vector, save=False)
+            for i, (item_name, grams) in enumerate(items):
+                if per_gram[i] is None and NutrientCache.normalize(item_name) == name:
+                    per_gram[i] = vector
+        if resolved and self.nutrient_cache:
+            self.nutrient_cache.save()
+
+    @staticmethod
+    def _batch_scale(items, per_gram):
+        return [
+            {key: value * grams for key, value in vector.items()} if vector is not None else None
+            for vector, (name, grams) in zip(per_gram, items)
+        ]
+
+    def close(self):
+        self.session.close()
+
+class AsyncBridge:
+    """asyncio event loop running on one background thread next to Tk's mainloop"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="asyncio", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        """Schedule a coroutine from any thread, returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+class AsyncNutritionixClient:
+    """Awaitable Nutritionix calls that share the blocking client's credentials and caches
+
+    Uses aiohttp when it is installed, otherwise the pooled requests session
+    runs on the loop's default executor. HTTP failures are raised as
+    requests exceptions either way so callers handle one error type.
+    """
+
+    def __init__(self, client, max_connections=20):
+        self.client = client
+        self.max_connections = max_connections
+        self._session = None
+        self._aiohttp = None
+        self._aiohttp_checked = False
+
+    async def _request(self, method, path, **kwargs):
+        url = f"{self.client.base_url}{path}"
+        loop = asyncio.get_running_loop()
+        if not self._aiohttp_checked:
+            # Imported off the loop, it takes a few hundred ms
+            self._aiohttp = await loop.run_in_executor(None, lazy_import, "aiohttp", True)
+            self._aiohttp_checked = True
+        aiohttp = self._aiohttp
+        if aiohttp is None:
+            # Fall back to the requests session on the loop's executor
+            response = await loop.run_in_executor(
+                None,
+                lambda: self.client.session.request(method, url, timeout=self.client.timeout, **kwargs)
+            )
+            response.raise_for_status()
+            return response.json()
+        
+        if self._session is None:
+            # Created on first use so it binds to the running loop
+            self._session = aiohttp.ClientSession(
+                headers={key: value for key, value in self.client.session.headers.items() if key.startswith("x-")},
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.client.timeout)
+            )
+        try:
+            async with self._session.request(method, url, **kwargs) as response:
+                if response.status >= 400:
+                    raise requests.HTTPError(f"{response.status} error for {url}")
+                return await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise requests.ConnectionError(str(e))
+
+    async def search(self, query):
+        """Awaitable NutritionixClient.search"""
+        search_cache = self.client.search_cache
+        results = search_cache.get(query) if search_cache else None
+        if results is None:
+            results = await self._request("GET", "/v2/search/instant", params={"query": query})
+            if search_cache:
+                search_cache.put(query, results)
+        return results
+
+    async def get_nutrients(self, food_name, grams):
+        """Awaitable NutritionixClient.get_nutrients"""
+        nutrient_cache = self.client.nutrient_cache
+        per_gram = nutrient_cache.get(food_name) if nutrient_cache else None
+        if per_gram is None:
+            result = await self._request("POST", "/v2/natural/nutrients", json={"query": f"100g {food_name}"})
+            foods = result.get('foods') or []
+            if not foods:
+                return None
+            per_gram = self.client._per_gram(foods[0])
+            if nutrient_cache:
+                nutrient_cache.put(food_name, per_gram)
+        return {key: value * grams for key, value in per_gram.items()}
+
+    async def get_nutrients_batch(self, items):
+        """Awaitable NutritionixClient.get_nutrients_batch"""
+        per_gram, missing = self.client._batch_cached(items)
+        if missing:
+            result = await self._request("POST", "/v2/natural/nutrients", json={"query": self.client._batch_query(missing)})
+            self.client._batch_resolve(items, per_gram, missing, result.get('foods') or [])
+        return self.client._batch_scale(items, per_gram)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+class ImageCache:
+    """Two-tier thumbnail cache: decoded CTkImages in a memory LRU, resized PNGs on disk"""
+
+    POLL_MS = 30
+
+    def __init__(self, root, directory="image_cache", max_images=256, session=None, workers=4):
+        self.root = root
+        self.directory = directory
+        self.max_images = max_images
+        self.session = session or requests.Session()
+        self._lock = threading.Lock()
+        # (url, size) -> CTkImage, least recently used first
+        self._images = OrderedDict()
+        # Downloads run here, CTkImages are only built on the Tk thread
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnails")
+        # (url, size) -> [future, callbacks], touched only on the Tk thread
+        self._pending = {}
+        self._polling = False
+        os.makedirs(directory, exist_ok=True)
+
+    def _disk_path(self, url, size):
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}_{size[0]}x{size[1]}.png")
+
+    def load_pil(self, url, size):
+        """Resized PIL image for url, from disk if we have it, otherwise downloaded and stored"""
+        path = self._disk_path(url, size)
+        try:
+            img = Image.open(path)
+            img.load()
+            return img
+        except (FileNotFoundError, OSError):
+            pass
+        response = self.session.get(url, timeout=10)
+        response.raise_for_status()
+        img = Image.open(BytesIO(response.content))
+        # JPEGs can be decoded straight at 1/2, 1/4 or 1/8 scale, much cheaper than full size
+        img.draft("RGB", (size[0] * 2, size[1] * 2))
+        img = img.convert("RGBA").resize(size, Image.Resampling.LANCZOS)
+        try:
+            tmp_path = path + ".tmp"
+            img.save(tmp_path, format="PNG")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Couldn't store thumbnail: {e}")
+        return img
+
+    def cached(self, url, size):
+        """CTkImage from the memory tier only, or None"""
+        with self._lock:
+            image = self._images.get((url, size))
+            if image is not None:
+                self._images.move_to_end((url, size))
+            return image
+
+    def store(self, url, size, img):
+        """Wrap a resized PIL image as a CTkImage and keep it in the memory tier"""
+        image = ctk.CTkImage(light_image=img, dark_image=img, size=size)
+        with self._lock:
+            self._images[(url, size)] = image
+            self._images.move_to_end((url, size))
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+        return image
+
+    def blank(self, size):
+        """Transparent CTkImage for clearing a recycled thumbnail label"""
+        key = (None, size)
+        image = self._images.get(key)
+        if image is None:
+            img = Image.new("RGBA", size, (0, 0, 0, 0))
+            image = self._images[key] = ctk.CTkImage(light_image=img, dark_image=img, size=size)
+        return image
+
+    def get(self, url, size):
+        """CTkImage for url at size, going to disk and then the network only on a miss"""
+        image = self.cached(url, size)
+        if image is None:
+            image = self.store(url, size, self.load_pil(url, size))
+        return image
+
+    def get_async(self, url, size, callback):
+        """Call callback(image) on the Tk thread once the thumbnail is ready
+
+        Memory hits call back right away, everything else is loaded on the
+        worker pool and handed over by polling from root.after.
+        """
+        image = self.cached(url, size)
+        if image is not None:
+            callback(image)
+            return
+        key = (url, size)
+        if key in self._pending:
+            self._pending[key][1].append(callback)
+        else:
+            self._pending[key] = [self._pool.submit(self.load_pil, url, size), [callback]]
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.POLL_MS, self._deliver)
+
+    def _deliver(self):
+        for key, (future, callbacks) in list(self._pending.items()):
+            if not future.done():
+                continue
+            del self._pending[key]
+            try:
+                image = self.store(key[0], key[1], future.result())
+            except Exception as e:
+                print(f"Error loading image: {e}")
+                continue
+            for callback in callbacks:
+                try:
+                    callback(image)
+                except Exception as e:
+                    # Usually the popup was closed before the image arrived
+                    print(f"Error showing image: {e}")
+        if self._pending:
+            self.root.after(self.POLL_MS, self._deliver)
+        else:
+            self._polling = False
+
+class EntryColumns:
+    """Typed-array storage for the numeric fields of many FoodEntry objects, one row per entry"""
+
+    NUMERIC = ('quantity', 'calories', 'protein', 'carbs', 'fats')
+
+    def __init__(self):
+        width = len(self.NUMERIC)
+        self.width = width
+        # Row r's fields live at values[r * width:(r + 1) * width]
+        self.values = array('d')
+        # Per row bitmasks: field was present / field was an int (so 250 doesn't come back as 250.0)
+        self.present = array('B')
+        self.is_int = array('B')
+        self._free = []
+        # Identical photo dicts (same food logged again) are stored once
+        self._photos = {}
+
+    def allocate(self):
+        if self._free:
+            row = self._free.pop()
+            self.present[row] = 0
+            self.is_int[row] = 0
+            return row
+        self.values.extend([0.0] * self.width)
+        self.present.append(0)
+        self.is_int.append(0)
+        return len(self.present) - 1
+
+    def release(self, row):
+        self._free.append(row)
+
+    @staticmethod
+    def photo_key(photo):
+        """Key equal only for photos with the same keys in the same order and values of the same types"""
+        # repr rather than the items, since True == 1 == 1.0 and those would otherwise merge
+        return repr(photo)
+
+    def shared_photo(self, photo):
+        return self._photos.setdefault(self.photo_key(photo), photo)
+
+class FoodEntry(MutableMapping):
+    """Compact food log entry that reads and writes like the dict it was built from
+
+    Text fields are interned slots, the macros and quantity live in a shared
+    EntryColumns row, and anything unexpected goes to a per-entry extras dict,
+    so dict(entry) round-trips the original JSON exactly.
+    """
+
+    # Slots for the usual keys, in the order the app writes them
+    TEXT = ('food', 'meal', 'notes', 'date', 'id', 'photo')
+    ORDER = ('food', 'quantity', 'meal', 'notes', 'calories', 'protein', 'carbs', 'fats', 'date', 'id', 'photo')
+    INTERNED = ('food', 'meal', 'notes', 'date')
+    _MISSING = object()
+    _FIELD_INDEX = {field: i for i, field in enumerate(EntryColumns.NUMERIC)}
+
+    __slots__ = ('food', 'meal', 'notes', 'date', 'id', 'photo', '_columns', '_row', '_extra')
+
+    def __init__(self, columns, fields=()):
+        for key in self.TEXT:
+            object.__setattr__(self, key, self._MISSING)
+        self._columns = columns
+        self._row = columns.allocate()
+        self._extra = None
+        for key, value in dict(fields).items():
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, entry, columns):
+        self = cls(columns)
+        values = columns.values
+        base = self._row * columns.width
+        present = is_int = 0
+        interned, intern = cls.INTERNED, sys.intern
+        for key, value in entry.items():
+            i = cls._FIELD_INDEX.get(key)
+            # The usual cases are handled inline, loading a big log goes through here for every entry
+            if i is not None:
+                if value.__class__ in (int, float):
+                    values[base + i] = value
+                    present |= 1 << i
+                    if value.__class__ is int:
+                        is_int |= 1 << i
+                    continue
+            elif value.__class__ is str and key in interned:
+                setattr(self, key, intern(value))
+                continue
+            elif key == 'id':
+                self.id = value
+                continue
+            self[key] = value
+        columns.present[self._row] |= present
+        columns.is_int[self._row] |= is_int
+        return self
+
+    def to_dict(self):
+        return dict(self)
+
+    def _numeric(self, i):
+        columns = self._columns
+        row = self._row
+        if not columns.present[row] >> i & 1:
+            raise KeyError(EntryColumns.NUMERIC[i])
+        value = columns.values[row * columns.width + i]
+        return int(value) if columns.is_int[row] >> i & 1 else value
+
+    def __getitem__(self, key):
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        i = self._FIELD_INDEX.get(key)
+        if i is not None:
+            return self._numeric(i)
+        if key in self.TEXT:
+            value = getattr(self, key)
+            if value is not self._MISSING:
+                return value
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        # Same as Mapping.get without the exception round trip, the index calls this a lot
+        if self._extra is None and key in self.TEXT:
+            value = getattr(self, key)
+            return default if value is self._MISSING else value
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        i = self._FIELD_INDEX.get(key)
+        if i is not None and isinstance(value, (int, float)) and not isinstance(value, bool):
+            columns = self._columns
+            row = self._row
+            columns.values[row * columns.width + i] = value
+            columns.present[row] |= 1 << i
+            if isinstance(value, int):
+                columns.is_int[row] |= 1 << i
+            else:
+                columns.is_int[row] &= ~(1 << i)
+            if self._extra is not None:
+                self._extra.pop(key, None)
+            return
+        if i is None and key in self.TEXT:
+            if key in self.INTERNED and isinstance(value, str):
+                value = sys.intern(value)
+            elif key == 'photo' and isinstance(value, dict):
+                value = self._columns.shared_photo(value)
+            object.__setattr__(self, key, value)
+            return
+        # Odd values (a macro stored as a string, say) and unknown keys keep their exact form here
+        if i is not None:
+            self._columns.present[self._row] &= ~(1 << i)
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if self._extra is not None and key in self._extra:
+            del self._extra[key]
+        elif key in self._FIELD_INDEX:
+            self._columns.present[self._row] &= ~(1 << self._FIELD_INDEX[key])
+        else:
+            object.__setattr__(self, key, self._MISSING)
+
+    def __iter__(self):
+        extra = self._extra or {}
+        for key in self.ORDER:
+            if key in extra or key in self:
+                yield key
+        for key in extra:
+            if key not in self.ORDER:
+                yield key
+
+    def __contains__(self, key):
+        if self._extra is not None and key in self._extra:
+            return True
+        i = self._FIELD_INDEX.get(key)
+        if i is not None:
+            return bool(self._columns.present[self._row] >> i & 1)
+        return key in self.TEXT and getattr(self, key) is not self._MISSING
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"FoodEntry({dict(self)!r})"
+
+    def detach(self):
+        """Move this entry's numbers onto a private row so its shared row can be reused"""
+        columns = EntryColumns()
+        row = columns.allocate()
+        old = self._columns
+        start = self._row * old.width
+        columns.values[0:old.width] = old.values[start:start + old.width]
+        columns.present[row] = old.present[self._row]
+        columns.is_int[row] = old.is_int[self._row]
+        old.release(self._row)
+        self._columns, self._row = columns, row
+
+class FoodLogIndex:
+    """In-memory food log indexed by date -> meal -> entries, plus an id -> entry map
+
+    Entries are stored as FoodEntry objects sharing one EntryColumns table.
+    """
+
+    MACROS = ('calories', 'protein', 'carbs', 'fats')
+
+    def __init__(self, entries=()):
+        self._columns = EntryColumns()
+        self._by_id = {}
+        # date -> meal -> {id: entry}, dicts keep entries in the order they were logged
+        self._by_date = {}
+        # Running macro sums, adjusted by each entry's delta on insert and unlink
+        self._day_totals = {}
+        self._meal_totals = {}
+        self._id_lock = threading.Lock()
+        self._last_id = 0
+        # Number of legacy entries that had no id and got one while loading
+        self.assigned_ids = 0
+        for entry in entries:
+            if isinstance(entry, (dict, FoodEntry)):
+                if not entry.get('id'):
+                    entry['id'] = self.next_id()
+                    self.assigned_ids += 1
+                self._insert(entry)
+
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, entry_id):
+        return entry_id in self._by_id
+
+    def next_id(self):
+        """Monotonic id in microseconds, never repeats even for adds in the same tick"""
+        with self._id_lock:
+            self._last_id = max(int(time.time() * 1_000_000), self._last_id + 1)
+            return str(self._last_id)
+
+    def _note_id(self, entry_id):
+        # Old ids are str(time.time()), keep new ids above them so ordering survives restarts
+        try:
+            value = int(float(entry_id) * 1_000_000) if '.' in entry_id else int(entry_id)
+        except (TypeError, ValueError):
+            return
+        with self._id_lock:
+            self._last_id = max(self._last_id, value)
+
+    def _macros(self, entry):
+        values = []
+        for key in self.MACROS:
+            try:
+                values.append(float(entry.get(key, 0) or 0))
+            except (ValueError, TypeError):
+                print(f"Error converting {key} for entry: {entry.get('food')}")
+                values.append(0.0)
+        return values
+
+    def _adjust(self, totals, key, values, sign):
+        current = totals.setdefault(key, [0.0] * len(self.MACROS))
+        for i, value in enumerate(values):
+            current[i] += sign * value
+
+    def _insert(self, entry):
+        if not isinstance(entry, FoodEntry):
+            entry = FoodEntry.from_dict(entry, self._columns)
+        self._note_id(entry['id'])
+        self._by_id[entry['id']] = entry
+        date, meal = entry.get('date'), entry.get('meal', 'Lunch')
+        meals = self._by_date.setdefault(date, {})
+        meals.setdefault(meal, {})[entry['id']] = entry
+        values = self._macros(entry)
+        self._adjust(self._day_totals, date, values, 1)
+        self._adjust(self._meal_totals, (date, meal), values, 1)
+        return entry
+
+    def _unlink(self, entry):
+        date, meal = entry.get('date'), entry.get('meal', 'Lunch')
+        meals = self._by_date.get(date, {})
+        bucket = meals.get(meal, {})
+        if bucket.pop(entry['id'], None) is None:
+            return
+        values = self._macros(entry)
+        self._adjust(self._day_totals, date, values, -1)
+        self._adjust(self._meal_totals, (date, meal), values, -1)
+        # Drop empty buckets, which also resets any float drift in their totals
+        if not bucket:
+            meals.pop(meal, None)
+            self._meal_totals.pop((date, meal), None)
+        if not meals:
+            self._by_date.pop(date, None)
+            self._day_totals.pop(date, None)
+
+    def add(self, entry):
+        """Store entry, returns the FoodEntry that now represents it"""
+        if not entry.get('id'):
+            entry['id'] = self.next_id()
+        replaced = self._by_id.get(entry['id'])
+        if replaced is not None:
+            self._unlink(replaced)
+            replaced.detach()
+        return self._insert(entry)
+
+    def get(self, entry_id):
+        return self._by_id.get(entry_id)
+
+    def remove(self, entry_id):
+        entry = self._by_id.pop(entry_id, None)
+        if entry is not None:
+            self._unlink(entry)
+            # Callers may still hold it, give it its own numbers before the row is reused
+            entry.detach()
+        return entry
+
+    def update(self, entry_id, fields):
+        entry = self._by_id.get(entry_id)
+        if entry is None:
+            return None
+        # Date or meal may change, so move the entry between buckets
+        self._unlink(entry)
+        entry.update(fields)
+        self._insert(entry)
+        return entry
+
+    def totals_for_date(self, date):
+        """Macro totals for a day as a dict, O(1)"""
+        return dict(zip(self.MACROS, self._day_totals.get(date, [0.0] * len(self.MACROS))))
+
+    def totals_for_meal(self, date, meal):
+        """Macro totals for one meal of a day as a dict, O(1)"""
+        return dict(zip(self.MACROS, self._meal_totals.get((date, meal), [0.0] * len(self.MACROS))))
+
+    def for_date(self, date):
+        return [entry for bucket in self._by_date.get(date, {}).values() for entry in bucket.values()]
+
+    def for_meal(self, date, meal):
+        return list(self._by_date.get(date, {}).get(meal, {}).values())
+
+    def in_range(self, start_date, end_date):
+        """Entries with start_date <= date <= end_date (YYYY-MM-DD strings)"""
+        dates = sorted(d for d in self._by_date if d and start_date <= d <= end_date)
+        return [entry for d in dates for entry in self.for_date(d)]
+
+class JsonLogFormat:
+    """food_log.json, the whole log as one JSON list"""
+
+    name = "json"
+    extension = ".json"
+
+    def sniff(self, payload):
+        # Fallback format, anything that isn't another format's file
+        return True
+
+    def encode(self, entries):
+        return json.dumps(entries).encode()
+
+    def decode(self, payload):
+        return json.loads(payload)
+
+    def write(self, path, entries):
+        atomic_write_bytes(path, self.encode(entries))
+
+class BinaryLogFormat:
+    """food_log.bin, a columnar binary snapshot
+
+    Entries shaped the way the app writes them are stored a column per field:
+    text fields as indexes into one table of distinct strings, ids as one
+    joined string, photos as indexes into a table of distinct photos, quantity
+    and macros as typed arrays. Any other entry is kept as JSON at its position,
+    so decode(encode(entries)) == entries, int vs float included.
+    """
+
+    name = "binary"
+    extension = ".bin"
+    MAGIC = b"AZFL"
+    VERSION = 1
+    # magic, version, byte order of the arrays (0 little, 1 big), entry count, section count
+    HEADER = struct.Struct("<4sBBII")
+    SECTION = struct.Struct("<Q")
+    TEXT = ('food', 'meal', 'notes', 'date')
+    # Ints beyond this lose precision in a float64 column
+    MAX_EXACT_INT = 2 ** 53
+
+    def sniff(self, payload):
+        return payload[:len(self.MAGIC)] == self.MAGIC
+
+    def _columnar(self, entry):
+        """True when entry has exactly the app's keys, in order, with the usual value types"""
+        if tuple(entry) != FoodEntry.ORDER:
+            return False
+        for key in self.TEXT + ('id',):
+            value = entry[key]
+            if value.__class__ is not str or "\0" in value:
+                return False
+        for key in EntryColumns.NUMERIC:
+            value = entry[key]
+            if value.__class__ is int:
+                if not -self.MAX_EXACT_INT <= value <= self.MAX_EXACT_INT:
+                    return False
+            elif value.__class__ is not float:
+                return False
+        return True
+
+    def _columns_ok(self, columns):
+        """Whole-column version of _columnar for rows whose keys already match, much cheaper per row"""
+        for key in self.TEXT + ('id',):
+            column = columns[key]
+            if set(map(type, column)) - {str}:
+                return False
+            if any("\0" in value for value in (column if key == 'id' else dict.fromkeys(column))):
+                return False
+        for key in EntryColumns.NUMERIC:
+            column = columns[key]
+            if set(map(type, column)) - {int, float}:
+                return False
+            if column and not -self.MAX_EXACT_INT <= min(column) <= max(column) <= self.MAX_EXACT_INT:
+                return False
+        return True
+
+    @staticmethod
+    def _typed(typecode, values):
+        """Section holding values as an array, prefixed with its typecode"""
+        return typecode.encode() + array(typecode, values).tobytes()
+
+    def _ints(self, values):
+        # Narrowest signed type that holds every value
+        low, high = (min(values), max(values)) if values else (0, 0)
+        for typecode in "bhiq":
+            limit = 1 << (array(typecode).itemsize * 8 - 1)
+            if -limit <= low and high < limit:
+                return self._typed(typecode, values)
+
+    @staticmethod
+    def _indexes(column, table):
+        """Index of each value of column in table (value -> index), adding the ones table doesn't have yet"""
+        for value in dict.fromkeys(column):
+            table.setdefault(value, len(table))
+        return list(map(table.__getitem__, column))
+
+    def encode(self, entries):
+        order = FoodEntry.ORDER
+        rows = []
+        row_positions = []
+        raw_positions = []
+        raw = []
+        for position, entry in enumerate(entries):
+            if isinstance(entry, FoodEntry):
+                entry = dict(entry)
+            if isinstance(entry, dict) and tuple(entry) == order:
+                rows.append(entry)
+                row_positions.append(position)
+            else:
+                raw_positions.append(position)
+                raw.append(entry)
+        columns = {key: [row[key] for row in rows] for key in order}
+        if not self._columns_ok(columns):
+            # Rare, somewhere a value has an odd type, sort it out row by row
+            fits = [self._columnar(row) for row in rows]
+            odd = [(position, row) for position, row, ok in zip(row_positions, rows, fits) if not ok]
+            rows = [row for row, ok in zip(rows, fits) if ok]
+            merged = sorted(list(zip(raw_positions, raw)) + odd, key=lambda item: item[0])
+            raw_positions = [position for position, _ in merged]
+            raw = [entry for _, entry in merged]
+            columns = {key: [row[key] for row in rows] for key in order}
+
+        sections = [self._ints(raw_positions), json.dumps(raw).encode()]
+        strings = {}
+        text_indexes = [self._indexes(columns[key], strings) for key in self.TEXT]
+        sections.append("\0".join(strings).encode())
+        sections.extend(self._ints(indexes) for indexes in text_indexes)
+        sections.append("\0".join(columns['id']).encode())
+
+        # Photos are mostly shared dicts (see EntryColumns.shared_photo), so each distinct object is keyed once
+        photo_column = columns['photo']
+        photos = []
+        slot_of_key = {}
+        slot_of_id = {}
+        for photo_id, photo in dict(zip(map(id, photo_column), photo_column)).items():
+            key = EntryColumns.photo_key(photo)
+            if key not in slot_of_key:
+                slot_of_key[key] = len(photos)
+                photos.append(photo)
+            slot_of_id[photo_id] = slot_of_key[key]
+        sections.append(json.dumps(photos).encode())
+        sections.append(self._ints(list(map(slot_of_id.__getitem__, map(id, photo_column)))))
+
+        # Each number column: its values, then a flag per row marking ints when the column mixes ints and floats
+        for key in EntryColumns.NUMERIC:
+            column = columns[key]
+            kinds = set(map(type, column))
+            if kinds == {int}:
+                sections += [self._ints(column), b""]
+            elif int in kinds:
+                sections += [self._typed('d', column), bytes([value.__class__ is int for value in column])]
+            else:
+                sections += [self._typed('d', column), b""]
+
+        parts = [self.HEADER.pack(self.MAGIC, self.VERSION, sys.byteorder == "big", len(entries), len(sections))]
+        for section in sections:
+            parts.append(self.SECTION.pack(len(section)))
+            parts.append(section)
+        return b"".join(parts)
+
+    def decode(self, payload):
+        magic, version, big_endian, count, section_count = self.HEADER.unpack_from(payload)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError(f"Unsupported food log format {magic!r} v{version}")
+        swap = big_endian != (sys.byteorder == "big")
+        view = memoryview(payload)
+        offset = self.HEADER.size
+        sections = []
+        for _ in range(section_count):
+            (length,) = self.SECTION.unpack_from(payload, offset)
+            offset += self.SECTION.size
+            sections.append(view[offset:offset + length])
+            offset += length
+        sections = iter(sections)
+
+        def typed(section):
+            values = array(chr(section[0]))
+            values.frombytes(section[1:])
+            if swap:
+                values.byteswap()
+            return values.tolist()
+
+        raw_positions = typed(next(sections))
+        raw = json.loads(bytes(next(sections)))
+        rows = count - len(raw_positions)
+        strings = str(next(sections), "utf-8").split("\0")
+        food, meal, notes, date = ([strings[i] for i in typed(next(sections))] for _ in self.TEXT)
+        ids = str(next(sections), "utf-8")
+        ids = ids.split("\0") if rows else []
+        photos = json.loads(bytes(next(sections)))
+        photo_column = [photos[i] for i in typed(next(sections))]
+        numbers = []
+        for _ in EntryColumns.NUMERIC:
+            column, is_int = typed(next(sections)), next(sections)
+            if is_int:
+                column = [int(value) if flag else value for value, flag in zip(column, is_int)]
+            numbers.append(column)
+        quantity, calories, protein, carbs, fats = numbers
+
+        entries = [
+            {'food': f, 'quantity': q, 'meal': m, 'notes': n, 'calories': cal, 'protein': p,
+             'carbs': c, 'fats': fa, 'date': d, 'id': i, 'photo': ph}
+            for f, q, m, n, cal, p, c, fa, d, i, ph
+            in zip(food, quantity, meal, notes, calories, protein, carbs, fats, date, ids, photo_column)
+        ]
+        if raw:
+            # Put the entries that didn't fit the columns back where they were
+            raw_at = dict(zip(raw_positions, raw))
+            columnar = iter(entries)
+            entries = [raw_at[i] if i in raw_at else next(columnar) for i in range(count)]
+        return entries
+
+    def write(self, path, entries):
+        atomic_write_bytes(path, self.encode(entries))
+
+FOOD_LOG_FORMATS = {fmt.name: fmt for fmt in (BinaryLogFormat(), JsonLogFormat())}
+
+def read_food_log_snapshot(path):
+    """Entries from a food log snapshot, in whichever format it was written"""
+    with open(path, "rb") as f:
+        payload = f.read()
+    for fmt in FOOD_LOG_FORMATS.values():
+        if fmt.sniff(payload):
+            return fmt.decode(payload)
+
+class FoodLogStore:
+    """Append-only journal of food log changes on top of a snapshot (see FOOD_LOG_FORMATS)
+
+    The snapshot and journal only hold the hot segment, the last hot_days days.
+    Older entries are moved into gzipped per-month archives (YYYY-MM.json.gz)
+    that are only read when a past date range is asked for.
+    """
+
+    # Date/id queries are answered by scanning the in-memory log
+    supports_queries = False
+
+    def __init__(self, snapshot_path=None, journal_path="food_log.journal", compact_every=500, writer=None,
+                 archive_dir="food_log_archive", hot_days=31, cached_months=3, snapshot_format="json"):
+        # Format new snapshots are written in, see FOOD_LOG_FORMATS
+        self.format = FOOD_LOG_FORMATS[snapshot_format]
+        self.snapshot_path = snapshot_path or "food_log" + self.format.extension
+        # Snapshot in another format that load() read instead, replaced by the next compaction
+        self.legacy_path = None
+        self.archive_dir = archive_dir
+        self.hot_days = hot_days
+        self.cached_months = cached_months
+        # "YYYY-MM" -> archived entries, least recently used first
+        self._month_cache = OrderedDict()
+        self._months = None
+        # PersistenceWorker for journal appends and snapshots, None to write inline
+        self.writer = writer
+        self.journal_path = journal_path
+        # Journal being folded into the snapshot by a background compaction
+        self.rotated_path = journal_path + ".old"
+        self.compact_every = compact_every
+        self.journal_length = 0
+        self._lock = threading.Lock()
+        self._compacting = False
+
+    def load(self):
+        """Load the snapshot and replay the journal tail on top of it"""
+        snapshot = self._read_snapshot()
+
+        # Key entries by id so replayed records can find them, keep order for display
+        entries = {}
+        for i, entry in enumerate(snapshot):
+            key = entry.get('id') if isinstance(entry, dict) and entry.get('id') else ("legacy", i)
+            entries[key] = entry
+
+        # A leftover rotated journal means the last compaction didn't finish, replay it first.
+        # Records are idempotent so replaying them over a newer snapshot is harmless.
+        self.journal_length = self._replay(self.rotated_path, entries)
+        self.journal_length += self._replay(self.journal_path, entries)
+        return list(entries.values())
+
+    def _read_snapshot(self):
+        """Entries in the snapshot, or in a snapshot of another format (food_log.json from before) if there is none"""
+        base = os.path.splitext(self.snapshot_path)[0]
+        legacy = [base + fmt.extension for fmt in FOOD_LOG_FORMATS.values() if base + fmt.extension != self.snapshot_path]
+        for path in [self.snapshot_path] + legacy:
+            try:
+                snapshot = read_food_log_snapshot(path)
+            except FileNotFoundError:
+                continue
+            if path != self.snapshot_path:
+                self.legacy_path = path
+            return snapshot
+        return []
+
+    def _replay(self, path, entries):
+        """Apply journal records from path to entries, returns the number of records read"""
+        count = 0
+        valid_bytes = 0
+        try:
+            with open(path, "rb") as f:
+                for raw in f:
+                    try:
+                        record = json.loads(raw) if raw.strip() else None
+                    except ValueError:
+                        # Torn write at the tail from a crash, cut it off so new records start clean
+                        print(f"Dropping corrupt journal tail in {path}")
+                        f.close()
+                        with open(path, "r+b") as out:
+                            out.truncate(valid_bytes)
+                        break
+                    valid_bytes += len(raw)
+                    if record is None:
+                        continue
+                    count += 1
+                    op = record.get('op')
+                    if op == "add":
+                        entries[record['entry']['id']] = record['entry']
+                    elif op == "update" and record['id'] in entries:
+                        entries[record['id']].update(record['fields'])
+                    elif op == "delete":
+                        entries.pop(record['id'], None)
+        except FileNotFoundError:
+            pass
+        return count
+
+    def append(self, record):
+        """Append a single record to the journal"""
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if self.writer is not None:
+                self.writer.append_line(self.journal_path, line)
+            else:
+                with open(self.journal_path, "a") as f:
+                    f.write(line)
+            self.journal_length += 1
+
+    def record_add(self, entry):
+        self.append({"op": "add", "entry": dict(entry)})
+
+    def record_update(self, entry_id, fields):
+        self.append({"op": "update", "id": entry_id, "fields": fields})
+
+    def record_delete(self, entry_id):
+        self.append({"op": "delete", "id": entry_id})
+
+    def needs_compaction(self):
+        # A snapshot still in the old format is converted by compacting once
+        return (self.journal_length >= self.compact_every or self.legacy_path is not None) and not self._compacting
+
+    def compact(self, food_log, background=True):
+        """Fold the journal into a fresh snapshot of food_log"""
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+            # Copy now, entries keep being edited in place on the UI thread
+            snapshot = [dict(entry) for entry in food_log]
+            if self.writer is not None:
+                # The worker rotates after writing the lines already queued, and before any queued after this
+                self.writer.call(self._rotate_journal)
+            else:
+                self._rotate_journal()
+            self.journal_length = 0
+            # If this write fails the new snapshot is missing, so the next load falls back to the legacy one again
+            legacy_path, self.legacy_path = self.legacy_path, None
+
+        if self.writer is not None:
+            # On a failed write the rotated journal stays and is replayed on the next load
+            self.writer.write_file(self.snapshot_path, snapshot, self.format.write, callback=lambda: self._snapshot_written(len(snapshot), legacy_path))
+            self._compacting = False
+            if not background:
+                self.writer.flush()
+        elif background:
+            threading.Thread(target=self._write_snapshot, args=(snapshot, legacy_path), daemon=True).start()
+        else:
+            self._write_snapshot(snapshot, legacy_path)
+
+    def _rotate_journal(self):
+        """New records go to a fresh journal while the old one is folded in"""
+        if os.path.exists(self.journal_path):
+            if os.path.exists(self.rotated_path):
+                # Previous compaction failed, keep its records with the new ones
+                with open(self.journal_path, "r") as src, open(self.rotated_path, "a") as dst:
+                    dst.write(src.read())
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, self.rotated_path)
+
+    def _write_snapshot(self, snapshot, legacy_path=None):
+        try:
+            self.format.write(self.snapshot_path, snapshot)
+            self._snapshot_written(len(snapshot), legacy_path)
+        except Exception as e:
+            print(f"7asal error fel compaction bta3 el food log: {str(e)}")
+        finally:
+            self._compacting = False
+
+    def _snapshot_written(self, count, legacy_path=None):
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+        if legacy_path is not None:
+            # Kept rather than deleted, in case the conversion needs undoing
+            os.replace(legacy_path, legacy_path + ".migrated")
+            print(f"Converted {legacy_path} to {self.snapshot_path}")
+        print(f"Compacted food log into {count} entries")
+
+    def hot_cutoff(self):
+        """Entries dated before this belong in the archives"""
+        return days_ago(self.hot_days)
+
+    def _archive_path(self, month):
+        return os.path.join(self.archive_dir, f"{month}.json.gz")
+
+    def archived_months(self):
+        if self._months is None:
+            try:
+                names = os.listdir(self.archive_dir)
+            except FileNotFoundError:
+                names = []
+            self._months = {name[:-len(".json.gz")] for name in names if name.endswith(".json.gz")}
+        return self._months
+
+    def _read_month(self, month):
+        try:
+            with gzip.open(self._archive_path(month), "rt") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def load_month(self, month):
+        """Archived entries for a "YYYY-MM" month, decompressed on first use"""
+        entries = self._month_cache.get(month)
+        if entries is None:
+            entries = self._read_month(month)
+            self._month_cache[month] = entries
+            while len(self._month_cache) > self.cached_months:
+                self._month_cache.popitem(last=False)
+        self._month_cache.move_to_end(month)
+        return entries
+
+    def archive(self, entries):
+        """Merge entries into their monthly archives, returns the ids now safely archived
+
+        Each archive is rewritten atomically before the caller drops the entries
+        from the hot snapshot, so a crash in between only archives them twice.
+        """
+        by_month = {}
+        for entry in entries:
+            by_month.setdefault(entry['date'][:7], []).append(dict(entry))
+        archived = []
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for month, month_entries in by_month.items():
+            merged = {entry['id']: entry for entry in self._read_month(month)}
+            merged.update((entry['id'], entry) for entry in month_entries)
+            ordered = sorted(merged.values(), key=lambda entry: entry.get('date', ''))
+            path = self._archive_path(month)
+            tmp_path = path + ".tmp"
+            try:
+                with gzip.open(tmp_path, "wt") as f:
+                    json.dump(ordered, f)
+                with open(tmp_path, "rb") as f:
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"7asal error fel archiving bta3 {month}: {str(e)}")
+                continue
+            self._month_cache.pop(month, None)
+            self.archived_months().add(month)
+            archived.extend(entry['id'] for entry in month_entries)
+        return archived
+
+    def archived_in_range(self, start_date, end_date):
+        """Archived entries with start_date <= date <= end_date, only touching the months in range"""
+        months = sorted(m for m in self.archived_months() if start_date[:7] <= m <= end_date[:7])
+        return [
+            entry for month in months for entry in self.load_month(month)
+            if start_date <= entry.get('date', '') <= end_date
+        ]
+
+class SQLiteFoodLogStore:
+    """Food log storage engine backed by an indexed SQLite database"""
+
+    supports_queries = True
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS entries (id TEXT PRIMARY KEY, date TEXT, meal TEXT, data TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_date ON entries (date)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_meal ON entries (meal)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+    ]
+    # Statements are kept constant so sqlite3 reuses its prepared copies
+    INSERT_SQL = "INSERT OR REPLACE INTO entries (id, date, meal, data) VALUES (?, ?, ?, ?)"
+    SELECT_ID_SQL = "SELECT data FROM entries WHERE id = ?"
+    SELECT_DATE_SQL = "SELECT data FROM entries WHERE date = ? ORDER BY rowid"
+    SELECT_RANGE_SQL = "SELECT data FROM entries WHERE date BETWEEN ? AND ? ORDER BY date, rowid"
+    SELECT_ALL_SQL = "SELECT data FROM entries ORDER BY rowid"
+    SELECT_HOT_SQL = "SELECT data FROM entries WHERE date >= ? OR date IS NULL ORDER BY rowid"
+    UPDATE_SQL = "UPDATE entries SET date = ?, meal = ?, data = ? WHERE id = ?"
+    DELETE_SQL = "DELETE FROM entries WHERE id = ?"
+
+    def __init__(self, db_path="food_log.db", json_path="food_log.json", journal_path="food_log.journal", hot_days=31):
+        self.db_path = db_path
+        self.hot_days = hot_days
+        self.json_path = json_path
+        self.journal_path = journal_path
+        self.conn = sqlite3.connect(db_path, cached_statements=32)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            for statement in self.SCHEMA:
+                self.conn.execute(statement)
+
+    def load(self):
+        """Load the last hot_days days, importing the old JSON food log on first run
+
+        Older entries stay in the database and are reached through entries_in_range.
+        """
+        self.migrate_from_json()
+        return [json.loads(row[0]) for row in self.conn.execute(self.SELECT_HOT_SQL, (self.hot_cutoff(),))]
+
+    def hot_cutoff(self):
+        return days_ago(self.hot_days)
+
+    def archive(self, entries):
+        # Everything already lives in the database, it just isn't loaded
+        return [entry['id'] for entry in entries]
+
+    def migrate_from_json(self):
+        """Copy the food log snapshot (food_log.json or .bin) and its journal into the database once"""
+        if self.conn.execute("SELECT value FROM meta WHERE key = 'migrated_from_json'").fetchone():
+            return
+        json_store = FoodLogStore(self.json_path, self.journal_path)
+        legacy = json_store.load()
+        # Including anything the JSON engine had already archived
+        legacy = json_store.archived_in_range("0000-00-00", "9999-99-99") + legacy
+        with self.conn:
+            for i, entry in enumerate(legacy):
+                if not isinstance(entry, dict):
+                    continue
+                if not entry.get('id'):
+                    entry['id'] = f"legacy-{i}"
+                self.conn.execute(self.INSERT_SQL, self._row(entry))
+            self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                (datetime.now().isoformat(),)
+            )
+        if legacy:
+            print(f"Migrated {len(legacy)} entries from {json_store.legacy_path or self.json_path} to {self.db_path}")
+
+    def _row(self, entry):
+        return (entry['id'], entry.get('date'), entry.get('meal'), json.dumps(dict(entry)))
+
+    def record_add(self, entry):
+        with self.conn:
+            self.conn.execute(self.INSERT_SQL, self._row(entry))
+
+    def record_update(self, entry_id, fields):
+        entry = self.get_entry(entry_id)
+        if entry is None:
+            return
+        entry.update(fields)
+        with self.conn:
+            self.conn.execute(self.UPDATE_SQL, (entry.get('date'), entry.get('meal'), json.dumps(entry), entry_id))
+
+    def record_delete(self, entry_id):
+        with self.conn:
+            self.conn.execute(self.DELETE_SQL, (entry_id,))
+
+    def get_entry(self, entry_id):
+        row = self.conn.execute(self.SELECT_ID_SQL, (entry_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def entries_for_date(self, date):
+        return [json.loads(row[0]) for row in self.conn.execute(self.SELECT_DATE_SQL, (date,))]
+
+    def entries_in_range(self, start_date, end_date):
+        """Entries with start_date <= date <= end_date (YYYY-MM-DD strings)"""
+        return [json.loads(row[0]) for row in self.conn.execute(self.SELECT_RANGE_SQL, (start_date, end_date))]
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, food_log, background=True):
+        """Every change is already committed, just fold the WAL back into the database"""
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+class TaskHandle:
+    """Handle to a task on the TaskScheduler, used to cancel it or hook its completion"""
+
+    def __init__(self, key, task_type=None, on_result=None):
+        self.key = key
+        # Results are routed by type, or straight to on_result when one is given
+        self.task_type = task_type
+        self.on_result = on_result
+        self.future = None
+        self.cancelled = False
+        self._done_callbacks = []
+
+    def cancel(self):
+        """Cancel the task, a result that still arrives is dropped"""
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def add_done_callback(self, callback):
+        """Run callback() on the Tk thread once the task finishes, fails or is cancelled"""
+        self._done_callbacks.append(callback)
+
+    def run_done_callbacks(self):
+        callbacks, self._done_callbacks = self._done_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in task callback: {e}")
+
+class TaskScheduler:
+    """Fixed worker pool for background calls with cancellation and dedup of in-flight work"""
+
+    def __init__(self, post, on_submit=None, workers=4, bridge=None):
+        # post(status, result, handle) hands the outcome back to the Tk thread
+        self.post = post
+        # Coroutine functions run on this AsyncBridge instead of the pool
+        self.bridge = bridge
+        # Called for every new (not coalesced) task, so the receiver knows a result is coming
+        self.on_submit = on_submit
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tasks")
+        self._lock = threading.Lock()
+        # key -> TaskHandle for tasks queued or running
+        self._in_flight = {}
+
+    def submit(self, fn, *args, key=None, task_type=None, on_result=None, **kwargs):
+        """Run fn on the pool, returns the existing handle if an identical task is in flight"""
+        with self._lock:
+            if key is not None and key in self._in_flight:
+                print(f"Coalescing duplicate task: {key[0]}")
+                return self._in_flight[key]
+            handle = TaskHandle(key, task_type, on_result)
+            if key is not None:
+                self._in_flight[key] = handle
+            if self.on_submit:
+                self.on_submit()
+            if self.bridge is not None and inspect.iscoroutinefunction(fn):
+                handle.future = self.bridge.submit(self._run_async(handle, fn, args, kwargs))
+            else:
+                handle.future = self._pool.submit(self._run, handle, fn, args, kwargs)
+        # A task cancelled before it started never reaches _run
+        handle.future.add_done_callback(lambda future: future.cancelled() and self._finish(handle, "cancelled", None))
+        return handle
+
+    def _run(self, handle, fn, args, kwargs):
+        status, result = "cancelled", None
+        try:
+            if not handle.cancelled:
+                result = fn(*args, **kwargs)
+                status = "success"
+        except Exception as e:
+            status, result = "error", str(e)
+        self._finish(handle, "cancelled" if handle.cancelled else status, result)
+
+    async def _run_async(self, handle, fn, args, kwargs):
+        try:
+            result = await fn(*args, **kwargs)
+            status = "success"
+        except asyncio.CancelledError:
+            # The future's done callback reports the cancellation
+            raise
+        except Exception as e:
+            status, result = "error", str(e)
+        self._finish(handle, "cancelled" if handle.cancelled else status, result)
+
+    def _finish(self, handle, status, result):
+        with self._lock:
+            if self._in_flight.get(handle.key) is handle:
+                del self._in_flight[handle.key]
+        self.post(status, result, handle)
+
+    def cancel_all(self):
+        with self._lock:
+            handles = list(self._in_flight.values())
+        for handle in handles:
+            handle.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+class TextStreamer:
+    """Collects streamed text from a background task and inserts it into a textbox once per frame"""
+
+    FRAME_MS = 16
+
+    def __init__(self, root, textbox, prefix="", suffix="", replace=False):
+        self.root = root
+        self.textbox = textbox
+        # Written around the streamed text, only if anything actually arrives
+        self.prefix = prefix
+        self.suffix = suffix
+        self.replace = replace
+        self.received = False
+        self._chunks = []
+        self._lock = threading.Lock()
+        self._active = False
+
+    def feed(self, text):
+        """Queue a chunk, safe to call from any thread"""
+        if text:
+            with self._lock:
+                self._chunks.append(text)
+
+    def start(self):
+        self._active = True
+        self.root.after(self.FRAME_MS, self._tick)
+
+    def finish(self):
+        """Flush whatever is left and stop, call on the Tk thread"""
+        self._active = False
+        self._flush()
+        if self.received and self.suffix:
+            self.textbox.insert("end", self.suffix)
+            self.textbox.see("end")
+
+    def _tick(self):
+        if not self._active:
+            return
+        self._flush()
+        self.root.after(self.FRAME_MS, self._tick)
+
+    def _flush(self):
+        with self._lock:
+            chunks, self._chunks = self._chunks, []
+        if not chunks or not self.textbox.winfo_exists():
+            return
+        text = "".join(chunks)
+        if not self.received:
+            self.received = True
+            if self.replace:
+                self.textbox.delete("1.0", "end")
+            text = self.prefix + text
+        # One insert per frame no matter how many chunks came in
+        self.textbox.insert("end", text)
+        self.textbox.see("end")
+
+class VirtualList(ctk.CTkFrame):
+    """Scrollable list that only builds row widgets for the visible slice and recycles them
+
+    make_row(parent) builds one empty row and returns a dict holding its 'frame',
+    which must be created with height=row_height; bind_row(row, item) fills it in
+    for an item. Rows sit at fixed heights, so the widget count and the work per
+    scroll or change depend on the viewport, not on the number of items.
+    """
+
+    WHEEL_EVENTS = ("<Button-4>", "<Button-5>") if "linux" in sys.platform else ("<MouseWheel>",)
+
+    def __init__(self, master, make_row, bind_row, row_height=50, **kwargs):
+        super().__init__(master, **kwargs)
+        self.make_row = make_row
+        self.bind_row = bind_row
+        self.row_height = row_height
+        self._keys = []
+        self._items = {}
+        # Row pool; item i is shown in slot i % len(pool) so scrolling one row rebinds one row
+        self._rows = []
+        self._slot_keys = []
+        self._key_slots = {}
+        self._top = 0
+        
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+        self.viewport = ctk.CTkFrame(self, fg_color="transparent")
+        self.viewport.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.yview)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.viewport.bind("<Configure>", lambda e: self._render())
+        
+        # Wheel bindings live on a tag of this list's own widgets, not app-wide, and go away in destroy()
+        self._wheel_tag = f"VirtualListWheel{id(self)}"
+        for sequence in self.WHEEL_EVENTS:
+            self.bind_class(self._wheel_tag, sequence, self._on_mouse_wheel)
+        for widget in (self, self.viewport, self.scrollbar):
+            self._add_wheel_tag(widget)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def set_items(self, items):
+        """Replace the contents with (key, item) pairs, in display order"""
+        self._keys = [key for key, item in items]
+        self._items = dict(items)
+        self._reset_slots()
+        self._render()
+
+    def upsert(self, key, item):
+        """Add item at the end, or rebind its row in place if key is already listed"""
+        if key in self._items:
+            self._items[key] = item
+            slot = self._key_slots.get(key)
+            if slot is not None:
+                self.bind_row(self._rows[slot], item)
+            return
+        self._keys.append(key)
+        self._items[key] = item
+        self._render()
+
+    def remove(self, key):
+        if key not in self._items:
+            return
+        del self._items[key]
+        self._keys.remove(key)
+        # Every row below it shifts up one slot
+        self._reset_slots()
+        self._render()
+
+    def _reset_slots(self):
+        self._slot_keys = [None] * len(self._rows)
+        self._key_slots = {}
+
+    def _viewport_height(self):
+        return self.viewport.winfo_height() / self._get_widget_scaling()
+
+    def _render(self):
+        height = self._viewport_height()
+        total = len(self._keys) * self.row_height
+        self._top = max(0, min(self._top, int(total - height)))
+        
+        # One extra row for the partly visible one at the bottom
+        wanted = min(int(height // self.row_height) + 2, len(self._keys))
+        if wanted > len(self._rows):
+            for _ in range(wanted - len(self._rows)):
+                row = self.make_row(self.viewport)
+                self._add_wheel_tag(row['frame'])
+                self._rows.append(row)
+            self._reset_slots()
+        
+        first = int(self._top // self.row_height)
+        shown = set()
+        for index in range(first, min(first + len(self._rows), len(self._keys))):
+            slot = index % len(self._rows)
+            key = self._keys[index]
+            row = self._rows[slot]
+            if self._slot_keys[slot] != key:
+                self._key_slots.pop(self._slot_keys[slot], None)
+                self.bind_row(row, self._items[key])
+                self._slot_keys[slot] = key
+                self._key_slots[key] = slot
+            row['frame'].place(x=0, y=index * self.row_height - self._top, relwidth=1)
+            shown.add(slot)
+        
+        for slot, row in enumerate(self._rows):
+            if slot not in shown:
+                row['frame'].place_forget()
+                self._key_slots.pop(self._slot_keys[slot], None)
+                self._slot_keys[slot] = None
+        
+        if total > 0:
+            self.scrollbar.set(self._top / total, min((self._top + height) / total, 1.0))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def yview(self, *args):
+        """Scrollbar command: ("moveto", fraction) or ("scroll", n, "units" | "pages")"""
+        if not args:
+            return
+        total = len(self._keys) * self.row_height
+        if args[0] == "moveto":
+            self._top = int(float(args[1]) * total)
+        elif args[0] == "scroll":
+            step = self.row_height if args[2] == "units" else int(self._viewport_height())
+            self._top += int(args[1]) * step
+        self._render()
+
+    def _add_wheel_tag(self, widget):
+        """Let wheel events over widget and everything inside it scroll this list"""
+        if self._wheel_tag not in widget.bindtags():
+            widget.bindtags((self._wheel_tag,) + widget.bindtags())
+        for child in widget.winfo_children():
+            self._add_wheel_tag(child)
+
+    def destroy(self):
+        for sequence in self.WHEEL_EVENTS:
+            self.unbind_class(self._wheel_tag, sequence)
+        super().destroy()
+
+    def _on_mouse_wheel(self, event):
+        if "linux" in sys.platform:
+            units = -1 if event.num == 4 else 1
+        elif sys.platform == "darwin":
+            units = -event.delta
+        else:
+            units = -int(event.delta / 120)
+        self.yview("scroll", units, "units")
+
+class ChatSession:
+    """AI coach conversation kept to a token budget: recent turns verbatim, older ones folded into a summary"""
+
+    def __init__(self, path="coach_session.json", window_tokens=1200, summary_tokens=250, writer=None, followup_gap=30 * 60):
+        self.path = path
+        self.writer = writer
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self.followup_gap = followup_gap
+        # Turns from before this launch are history, not something a new question follows up on
+        self.started = time.time()
+        self._lock = threading.Lock()
+        # [{"role": "user" | "coach", "text": ..., "at": timestamp}], oldest first
+        self.turns = []
+        self.summary = ""
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.turns = list(data.get("turns", []))
+            self.summary = data.get("summary", "")
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, ValueError, TypeError, AttributeError) as e:
+            print(f"Ignoring unreadable coach session: {str(e)}")
+
+    @staticmethod
+    def estimate_tokens(text):
+        # Roughly 4 characters per token for English, no network round trip to count them
+        return len(text) // 4 + 1
+
+    @staticmethod
+    def _line(turn):
+        speaker = "User" if turn['role'] == "user" else "Coach"
+        return f"{speaker}: {turn['text']}"
+
+    def is_empty(self):
+        return not self.turns and not self.summary
+
+    def in_conversation(self):
+        """True if the last answer came in this launch less than followup_gap seconds ago
+
+        Only then can a new question lean on earlier turns. After a pause, a
+        restart or with only the summary left, it is treated as standalone.
+        """
+        with self._lock:
+            last = self.turns[-1].get("at") if self.turns else None
+        return last is not None and last >= self.started and time.time() - last < self.followup_gap
+
+    def build_prompt(self, question):
+        """Prompt with the summary, as many recent turns as fit the budget, and the new question"""
+        with self._lock:
+            budget = self.window_tokens - self.estimate_tokens(question)
+            recent = []
+            for turn in reversed(self.turns):
+                line = self._line(turn)
+                budget -= self.estimate_tokens(line)
+                if budget < 0:
+                    break
+                recent.append(line)
+            recent.reverse()
+            summary = self.summary
+        parts = ["You are a friendly, knowledgeable fitness and nutrition coach. Answer the user's latest message."]
+        if summary:
+            parts.append(f"Summary of the earlier conversation:\n{summary}")
+        if recent:
+            parts.append("Recent conversation:\n" + "\n".join(recent))
+        parts.append(f"User: {question}\nCoach:")
+        return "\n\n".join(parts)
+
+    def add_exchange(self, question, answer):
+        now = time.time()
+        with self._lock:
+            self.turns.append({"role": "user", "text": question, "at": now})
+            self.turns.append({"role": "coach", "text": answer, "at": now})
+        self.save()
+
+    def overflow(self):
+        """Oldest turns that no longer fit the window and should be folded into the summary"""
+        with self._lock:
+            total = sum(self.estimate_tokens(self._line(turn)) for turn in self.turns)
+            count = 0
+            while total > self.window_tokens and count < len(self.turns):
+                total -= self.estimate_tokens(self._line(self.turns[count]))
+                count += 1
+            return self.summary, self.turns[:count]
+
+    def summary_prompt(self, summary, turns):
+        lines = "\n".join(self._line(turn) for turn in turns)
+        return (f"Update this running summary of a fitness coaching chat with the new messages. "
+                f"Keep the user's goals, stats, preferences and any advice given. "
+                f"Reply with the summary only, at most {self.summary_tokens * 3 // 4} words.\n\n"
+                f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{lines}")
+
+    def fallback_summary(self, summary, turns):
+        """Summary without the model: the first sentence of each folded turn, newest kept"""
+        lines = [summary] if summary else []
+        for turn in turns:
+            lines.append(self._line(turn).split(". ")[0].split("\n")[0])
+        return self._clip("\n".join(lines))
+
+    def _clip(self, text):
+        """Keep the newest part of text that fits the summary budget, starting at a line boundary"""
+        limit = self.summary_tokens * 4
+        if len(text) <= limit:
+            return text
+        text = text[-limit:]
+        return text.split("\n", 1)[1] if "\n" in text else text
+
+    def fold(self, turns, summary):
+        """Replace the folded turns with the new summary, if they are still the oldest turns"""
+        with self._lock:
+            if self.turns[:len(turns)] != turns:
+                return
+            del self.turns[:len(turns)]
+            # Keep the summary inside its budget even if the model ran long
+            self.summary = self._clip(summary.strip())
+        self.save()
+
+    def clear(self):
+        with self._lock:
+            self.turns = []
+            self.summary = ""
+        self.save()
+
+    def save(self):
+        with self._lock:
+            data = {"turns": list(self.turns), "summary": self.summary}
+        try:
+            save_json(self.path, data, self.writer)
+        except OSError as e:
+            print(f"7asal error fel saving bta3 el coach session: {str(e)}")
 
 class AZFoodLogger:
+    # check_queue polling bounds while background results are outstanding
+    POLL_MIN_MS = 15
+    POLL_MAX_MS = 200
+    # How often to stat user_profile.json for outside edits
+    PROFILE_CHECK_MS = 2000
+    # Fixed row heights for the virtualized lists
+    FOOD_ROW_HEIGHT = 54
+    SEARCH_ROW_HEIGHT = 64
+    # Today's Progress bars: (macro, label, profile goal field, default goal, unit, color)
+    MACRO_BARS = [
+        ('calories', "Calories", 'daily_calories', 2000, "kcal", "#FF6B6B"),
+        ('protein', "Protein", 'daily_protein', 150, "g", "#4ECDC4"),
+        ('carbs', "Carbs", 'daily_carbs', 250, "g", "#45B7D1"),
+        ('fats', "Fats", 'daily_fats', 65, "g", "#96CEB4")
+    ]
+
     def __init__(self):
         self.window = ctk.CTk()
         self.window.title("AZ WORKOUT")
@@ -49,115 +2469,262 @@ class AZFoodLogger:
         
         # Initialize async queue for API calls
         self.queue = Queue()
+        self.pending_results = 0
+        self.poll_interval = self.POLL_MIN_MS
+        self.queue_polling = False
+        
+        # Event loop for network calls, plus a worker pool for blocking work.
+        # Results from both come back through self.queue
+        self.async_bridge = AsyncBridge()
+        self.scheduler = TaskScheduler(
+            lambda status, result, handle: self.queue.put((status, result, handle)),
+            on_submit=self.expect_result,
+            bridge=self.async_bridge
+        )
+        
+        # File writes happen behind the UI, flushed on exit even if run() never returns normally
+        self.persistence = PersistenceWorker()
+        atexit.register(self.persistence.close)
+        
+        # Where each type of background result goes, always called on the Tk thread
+        self.result_handlers = {
+            "workout_plan": self.show_workout_plan,
+            "coach_answer": self.show_coach_answer
+        }
+        
+        # Shared Nutritionix session
+        self.nutritionix = NutritionixClient(
+            NUTRITIONIX_APP_ID,
+            NUTRITIONIX_API_KEY,
+            nutrient_cache=NutrientCache(writer=self.persistence),
+            search_cache=SearchCache()
+        )
+        
+        self.async_nutritionix = AsyncNutritionixClient(self.nutritionix)
+        self.workout_plan_cache = WorkoutPlanCache(writer=self.persistence)
+        self.chat_session = ChatSession(writer=self.persistence, followup_gap=COACH_FOLLOWUP_MINUTES * 60)
+        self.coach_cache = CoachAnswerCache(
+            threshold=COACH_CACHE_THRESHOLD,
+            max_age=COACH_CACHE_MAX_AGE_DAYS * 24 * 3600,
+            writer=self.persistence
+        )
+        
+        # Thumbnails for search results and logged foods
+        self.image_cache = ImageCache(self.window)
+        
+        # Storage engine for the food log
+        if FOOD_LOG_ENGINE == "sqlite":
+            self.food_store = SQLiteFoodLogStore(hot_days=FOOD_LOG_HOT_DAYS)
+        else:
+            self.food_store = FoodLogStore(writer=self.persistence, hot_days=FOOD_LOG_HOT_DAYS, snapshot_format=FOOD_LOG_FORMAT)
+        
+        # Profile reads come from memory, external edits are picked up by watch_profile
+        self.profile_store = ProfileStore(writer=self.persistence)
+        self.profile_store.subscribe(self.on_profile_changed)
+        
+        # Gemini is built on first use, see get_model
+        self.model = None
+        self.model_lock = threading.Lock()
         
         # Continue with initialization
         if not self.load_user_profile():
             self.show_initial_setup()
         else:
             self.food_log = self.load_food_log()
-            self.initialize_gemini()
             self.workout_plan = self.load_workout_plan()
             self.progress_data = self.load_progress_data()
             self.setup_gui()
             self.refresh_food_log()
+            self.initialize_gemini()
+            self.watch_profile()
 
     def initialize_gemini(self):
-        try:
-            genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-            self.model = genai.GenerativeModel('gemini-pro')
-            self.loading_var.set("")
-            print("el gemini et3amal ya m3alem")
-        except Exception as e:
-            print(f"7asal error fel gemini ya ray2: {str(e)}")
-            self.show_error(f"Failed to initialize AI: {str(e)}")
+        """Warm up the Gemini model in the background once the window has painted"""
+        self.window.after_idle(lambda: self.submit_task(
+            self.get_model,
+            task_type="gemini_warmup",
+            key=("gemini_warmup",),
+            indicator=False,
+            on_result=lambda model: None
+        ))
 
-    @staticmethod
-    def async_api_call(func):
-        """Decorator for async API calls"""
-        def wrapper(self, *args, **kwargs):
-            # Get the appropriate loading variable based on the function name
-            if 'workout' in func.__name__:
-                loading_var = self.workout_loading_var
-            elif 'ai_coach' in func.__name__:
-                loading_var = self.ai_loading_var
-            else:
-                loading_var = self.loading_var
-            
-            loading_var.set("Processing...")
-            
-            def task():
+    def get_model(self):
+        """The Gemini model, imported and configured on first use, safe to call from any thread"""
+        with self.model_lock:
+            if self.model is None:
                 try:
-                    result = func(self, *args, **kwargs)
-                    self.queue.put(("success", result))
+                    genai = lazy_import("google.generativeai")
+                    genai.configure(api_key=GOOGLE_API_KEY)
+                    self.model = genai.GenerativeModel('gemini-pro')
+                    print("el gemini et3amal ya m3alem")
                 except Exception as e:
-                    self.queue.put(("error", str(e)))
-                finally:
-                    loading_var.set("")
+                    print(f"7asal error fel gemini ya ray2: {str(e)}")
+                    raise Exception(f"Failed to initialize AI: {str(e)}")
+            return self.model
+
+    async def get_model_async(self):
+        """get_model without blocking the asyncio loop while the first call imports the SDK"""
+        if self.model is not None:
+            return self.model
+        return await asyncio.get_running_loop().run_in_executor(None, self.get_model)
+
+    @staticmethod
+    def async_api_call(task_type):
+        """Decorator that runs an API call on the task scheduler
+
+        The wrapped function runs on a worker thread, or on the asyncio loop if it
+        is a coroutine function, so it must not touch widgets. Its result is routed to self.result_handlers[task_type] on the Tk thread.
+        Identical calls already in flight are coalesced into one task. Returns
+        the TaskHandle, whose done callbacks also run on the Tk thread.
+        """
+        def decorator(func):
+            def wrapper(self, *args, on_result=None, **kwargs):
+                # Keyword arguments (like a streamer) are left out of the coalescing key
+                return self.submit_task(
+                    func, self, *args,
+                    task_type=task_type,
+                    key=(task_type,) + args,
+                    on_result=on_result,
+                    **kwargs
+                )
             
-            threading.Thread(target=task, daemon=True).start()
-            self.window.after(100, self.check_queue)
+            return wrapper
+        
+        return decorator
+
+    def submit_task(self, fn, *args, task_type, key=None, on_result=None, indicator=True, **kwargs):
+        """Run fn (plain or async) in the background and route its result by task_type
+
+        Shows the matching loading indicator until the task finishes, unless
+        indicator is False (work the user didn't ask for, like warm-ups).
+        """
+        # Get the appropriate loading variable based on the task type
+        if not indicator:
+            loading_var = None
+        elif 'workout' in task_type:
+            loading_var = self.workout_loading_var
+        elif 'coach' in task_type:
+            loading_var = self.ai_loading_var
+        else:
+            loading_var = self.loading_var
+        
+        if loading_var is not None:
+            loading_var.set("Processing...")
         
-        return wrapper
+        handle = self.scheduler.submit(
+            fn, *args,
+            key=key,
+            task_type=task_type,
+            on_result=on_result,
+            **kwargs
+        )
+        if loading_var is not None:
+            handle.add_done_callback(lambda: loading_var.set(""))
+        return handle
+
+    def expect_result(self):
+        """Called for each new background task, starts check_queue polling if it is idle"""
+        self.pending_results += 1
+        self.poll_interval = self.POLL_MIN_MS
+        if not self.queue_polling:
+            self.queue_polling = True
+            self.window.after(self.poll_interval, self.check_queue)
 
     def check_queue(self):
-        """Check for completed API calls"""
-        try:
-            status, result = self.queue.get_nowait()
-            if status == "error":
-                self.show_error(result)
+        """Deliver every completed API call, polling faster while results are arriving"""
+        delivered = 0
+        while True:
+            try:
+                status, result, handle = self.queue.get_nowait()
+            except Empty:
+                break
+            delivered += 1
+            self.pending_results -= 1
+            try:
+                # UI cleanup for the task runs here, on the Tk thread
+                handle.run_done_callbacks()
+                if status == "error":
+                    self.show_error(result)
+                elif status == "success":
+                    self.handle_api_result(handle, result)
+            except Exception as e:
+                print(f"Error handling {handle.task_type} result: {str(e)}")
+        
+        if self.pending_results > 0:
+            # Back off while waiting, snap back once results start coming in
+            if delivered:
+                self.poll_interval = self.POLL_MIN_MS
             else:
-                self.handle_api_result(result)
-        except Empty:
-            self.window.after(100, self.check_queue)
+                self.poll_interval = min(self.poll_interval * 2, self.POLL_MAX_MS)
+            self.window.after(self.poll_interval, self.check_queue)
+        else:
+            # Nothing outstanding, stay quiet until expect_result is called again
+            self.queue_polling = False
 
-    @async_api_call
-    def generate_workout_plan(self):
-        """Generate a workout plan using AI"""
-        print("ya 7biby bgenerating el workout plan...")  # Egyptian Franko
+    def generate_workout_plan(self, force=False):
+        """Show the cached plan for the current stats, or generate one using AI (always when force)"""
+        if self.generate_button.cget("state") == "disabled":
+            return
         
-        # Disable the generate button while processing
-        self.generate_button.configure(state="disabled")
+        print("ya 7biby bgenerating el workout plan...")  # Egyptian Franko
         
         # Validate user profile
         if not self.validate_user_profile():
             self.show_error("Please complete your profile first")
-            self.generate_button.configure(state="normal")
             return
         
         user_stats = self.get_user_stats()
-        prompt = f"""Create a detailed 5-day bodybuilding workout plan:
-
-Overview:
-- Rest days and schedule
-- Progression guidelines
-- Cardio recommendations
-- Nutrition tips
-- General guidelines
-
-For each day (Days 1-5), provide:
-Day [X]: [Focus]
-- Detailed exercise list with sets, reps, and rest periods
-- Form cues and tips
-- Progression suggestions
+        prompt = WORKOUT_PROMPT_TEMPLATE.format(**user_stats)
+        cache_key = WorkoutPlanCache.key_for(user_stats)
+        if not force:
+            cached_plan = self.workout_plan_cache.get(cache_key)
+            if cached_plan is not None:
+                print("el plan da mawgood fel cache ya m3alem")  # Egyptian Franko
+                self.show_workout_plan(cached_plan)
+                return
+        
+        # Disable the generate buttons while processing
+        self.generate_button.configure(state="disabled")
+        self.regenerate_button.configure(state="disabled")
+        
+        # The old plan stays until the first chunk of the new one arrives
+        streamer = TextStreamer(self.window, self.workout_text, replace=True)
+        streamer.start()
+        self.workout_task = self.request_workout_plan(
+            prompt,
+            streamer=streamer,
+            on_result=lambda plan: self.show_workout_plan(plan, streamer, cache_key, user_stats)
+        )
+        self.workout_task.add_done_callback(streamer.finish)
+        self.workout_task.add_done_callback(lambda: self.generate_button.configure(state="normal"))
+        self.workout_task.add_done_callback(lambda: self.regenerate_button.configure(state="normal"))
 
-User stats:
-- Weight: {user_stats['weight']}kg
-- Height: {user_stats['height']}cm
-- Goal: {user_stats['goal']}
-- Experience: {user_stats.get('experience', 'Intermediate')}
+    async def stream_model_response(self, prompt, streamer):
+        """Stream a Gemini response into streamer, returns the full text"""
+        model = await self.get_model_async()
+        response = await model.generate_content_async(prompt, stream=True)
+        parts = []
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunk without text parts, e.g. only safety metadata
+                continue
+            parts.append(text)
+            streamer.feed(text)
+        return "".join(parts)
 
-Please provide a comprehensive and detailed plan with clear formatting."""
-        
+    @async_api_call("workout_plan")
+    async def request_workout_plan(self, prompt, streamer):
+        """Ask the model for a workout plan, runs on the asyncio loop"""
+        print("Sending request to AI model...")  # Debug print
         try:
-            print("Sending request to AI model...")  # Debug print
-            response = self.model.generate_content(prompt)
-            print("Received response from AI model")  # Debug print
-            return response.text
+            plan = await self.stream_model_response(prompt, streamer)
         except Exception as e:
             print(f"Error in generate_workout_plan: {str(e)}")  # Debug print
-            self.show_error(f"Error generating workout plan: {str(e)}")
-            self.generate_button.configure(state="normal")
-            return None
+            raise Exception(f"Error generating workout plan: {str(e)}")
+        print("Received response from AI model")  # Debug print
+        return plan
 
     def validate_user_profile(self):
         """Validate that required user profile fields are filled"""
@@ -308,22 +2875,27 @@ Please provide a comprehensive and detailed plan with clear formatting."""
         )
         name_frame.pack(fill="x", padx=15, pady=(0, 10))
         
-        ctk.CTkLabel(
+        # field -> (label, format), refreshed by on_profile_changed
+        self.summary_labels = {}
+        
+        name_label = ctk.CTkLabel(
             name_frame,
             text=profile['name'],
             font=("Helvetica", 20, "bold"),
             text_color=("#ffffff", "#ffffff")
-        ).pack(pady=5)
+        )
+        name_label.pack(pady=5)
+        self.summary_labels['name'] = (name_label, "{}")
         
         # Current stats with modern cards
         stats = [
-            ("Current Weight", f"{profile['weight']} kg"),
-            ("Height", f"{profile['height']} cm"),
-            ("Goal", profile['goal']),
-            ("Activity Level", profile['activity_level'])
+            ("Current Weight", 'weight', "{} kg"),
+            ("Height", 'height', "{} cm"),
+            ("Goal", 'goal', "{}"),
+            ("Activity Level", 'activity_level', "{}")
         ]
         
-        for label, value in stats:
+        for label, field, value_format in stats:
             card = ctk.CTkFrame(
                 self.left_frame,
                 fg_color=("#333333", "#252525"),
@@ -338,64 +2910,55 @@ Please provide a comprehensive and detailed plan with clear formatting."""
                 text_color=("#bbbbbb", "#bbbbbb")
             ).pack(anchor="w", padx=10, pady=(5, 0))
             
-            ctk.CTkLabel(
+            value_label = ctk.CTkLabel(
                 card,
-                text=value,
+                text=value_format.format(profile[field]),
                 font=("Helvetica", 14, "bold"),
                 text_color=("#ffffff", "#ffffff")
-            ).pack(anchor="w", padx=10, pady=(0, 5))
+            )
+            value_label.pack(anchor="w", padx=10, pady=(0, 5))
+            self.summary_labels[field] = (value_label, value_format)
         
         # Add macro tracking with modern progress bars
         self.create_macro_progress_bars(self.left_frame)
 
+    def on_profile_changed(self, changed):
+        """Update the summary cards and progress targets for the profile fields that changed"""
+        for field, value in changed.items():
+            label, value_format = getattr(self, 'summary_labels', {}).get(field, (None, None))
+            if label is not None and label.winfo_exists():
+                label.configure(text=value_format.format(value))
+        if any(field.startswith('daily_') for field in changed):
+            self.update_macro_progress_bars()
+
+    def watch_profile(self):
+        """Pick up edits made to user_profile.json outside the app"""
+        self.profile_store.check()
+        self.window.after(self.PROFILE_CHECK_MS, self.watch_profile)
+
     def create_macro_progress_bars(self, parent):
-        for widget in parent.winfo_children():
-            if isinstance(widget, ctk.CTkFrame) and widget.winfo_children() and isinstance(widget.winfo_children()[0], ctk.CTkLabel) and widget.winfo_children()[0].cget("text") == "Today's Progress":
-                widget.destroy()
+        """Build the Today's Progress panel once, update_macro_progress_bars fills in the values"""
+        if getattr(self, 'progress_frame', None) is not None and self.progress_frame.winfo_exists():
+            self.progress_frame.destroy()
 
-        progress_frame = ctk.CTkFrame(
+        self.progress_frame = ctk.CTkFrame(
             parent,
             fg_color="transparent"
         )
-        progress_frame.pack(fill="x", padx=15, pady=15)
+        self.progress_frame.pack(fill="x", padx=15, pady=15)
         
         ctk.CTkLabel(
-            progress_frame,
+            self.progress_frame,
             text="Today's Progress",
             font=("Helvetica", 16, "bold"),
             text_color=("#ffffff", "#ffffff")
         ).pack(pady=(0, 10))
         
-        profile = self.load_user_profile()
-        todays_log = self.get_todays_log()
-        
-        try:
-            current = {
-                'calories': sum(float(food.get('calories', 0)) for food in todays_log),
-                'protein': sum(float(food.get('protein', 0)) for food in todays_log),
-                'carbs': sum(float(food.get('carbs', 0)) for food in todays_log),
-                'fats': sum(float(food.get('fats', 0)) for food in todays_log)
-            }
-            
-            print(f"el total calories: {current['calories']}")
-            print(f"el total protein: {current['protein']}")
-            print(f"el total carbs: {current['carbs']}")
-            print(f"el total fats: {current['fats']}")
-            
-        except Exception as e:
-            print(f"7asal error fel 7esabat: {str(e)}")
-            current = {'calories': 0, 'protein': 0, 'carbs': 0, 'fats': 0}
-        
-        metrics = [
-            ("Calories", current['calories'], float(profile.get('daily_calories', 2000)), "kcal", "#FF6B6B"),
-            ("Protein", current['protein'], float(profile.get('daily_protein', 150)), "g", "#4ECDC4"),
-            ("Carbs", current['carbs'], float(profile.get('daily_carbs', 250)), "g", "#45B7D1"),
-            ("Fats", current['fats'], float(profile.get('daily_fats', 65)), "g", "#96CEB4")
-        ]
-        
-        for label, current_val, goal, unit, color in metrics:
+        # macro -> (value label, progress bar), updated in place on every change
+        self.macro_bars = {}
+        for macro, label, goal_field, default_goal, unit, color in self.MACRO_BARS:
             metric_frame = ctk.CTkFrame(
-                progress_frame,
+                self.progress_frame,
                 fg_color=("#333333", "#252525"),
                 corner_radius=10
             )
@@ -414,12 +2977,13 @@ Please provide a comprehensive and detailed plan with clear formatting."""
                 text_color=("#bbbbbb", "#bbbbbb")
             ).pack(side="left")
             
-            ctk.CTkLabel(
+            value_label = ctk.CTkLabel(
                 header_frame,
-                text=f"{int(current_val)}/{int(goal)}{unit}",
+                text="",
                 font=("Helvetica", 12),
                 text_color=("#ffffff", "#ffffff")
-            ).pack(side="right")
+            )
+            value_label.pack(side="right")
             
             progress = ctk.CTkProgressBar(
                 metric_frame,
@@ -428,6 +2992,35 @@ Please provide a comprehensive and detailed plan with clear formatting."""
             )
             progress.pack(fill="x", padx=10, pady=(5, 10))
             
+            self.macro_bars[macro] = (value_label, progress)
+        
+        self.update_macro_progress_bars()
+
+    def update_macro_progress_bars(self):
+        """Set today's totals on the existing progress bars"""
+        if not getattr(self, 'macro_bars', None):
+            return
+        
+        profile = self.load_user_profile()
+        
+        try:
+            current = self.food_log.totals_for_date(datetime.now().strftime("%Y-%m-%d"))
+            
+            print(f"el total calories: {current['calories']}")
+            print(f"el total protein: {current['protein']}")
+            print(f"el total carbs: {current['carbs']}")
+            print(f"el total fats: {current['fats']}")
+            
+        except Exception as e:
+            print(f"7asal error fel 7esabat: {str(e)}")
+            current = {'calories': 0, 'protein': 0, 'carbs': 0, 'fats': 0}
+        
+        for macro, label, goal_field, default_goal, unit, color in self.MACRO_BARS:
+            value_label, progress = self.macro_bars[macro]
+            current_val = current[macro]
+            goal = float(profile.get(goal_field, default_goal))
+            value_label.configure(text=f"{int(current_val)}/{int(goal)}{unit}")
+            
             try:
                 progress_value = min(float(current_val)/float(goal), 1.0) if float(goal) > 0 else 0
                 progress.set(progress_value)
@@ -440,7 +3033,7 @@ Please provide a comprehensive and detailed plan with clear formatting."""
         main_container.pack(fill="both", expand=True, padx=5, pady=5)
         
         main_container.grid_columnconfigure(0, weight=1)
-        main_container.grid_rowconfigure(1, weight=1)
+        main_container.grid_rowconfigure(2, weight=1)
         
         search_frame = ctk.CTkFrame(main_container, fg_color=("#333333", "#252525"))
         search_frame.grid(row=0, column=0, sticky="ew", padx=5, pady=5)
@@ -464,14 +3057,18 @@ Please provide a comprehensive and detailed plan with clear formatting."""
             hover_color=("#555555", "#444444")
         ).grid(row=0, column=1, padx=10, pady=10)
         
+        self.setup_meal_builder(main_container)
+        
         meals_container = ctk.CTkFrame(main_container)
-        meals_container.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
+        meals_container.grid(row=2, column=0, sticky="nsew", padx=5, pady=5)
         meals_container.grid_columnconfigure(0, weight=1)
         meals_container.grid_columnconfigure(1, weight=1)
         meals_container.grid_rowconfigure(1, weight=1)
         
         self.meal_sections = {}
         self.meal_calories_labels = {}
+        # entry id -> meal list showing it, see render_food_entry
+        self.entry_rows = {}
         meal_types = ["Breakfast", "Lunch"]
         
         for i, meal_type in enumerate(meal_types):
@@ -499,14 +3096,177 @@ Please provide a comprehensive and detailed plan with clear formatting."""
             
             self.meal_calories_labels[meal_type] = calories_label
             
-            food_frame = ctk.CTkScrollableFrame(
+            food_frame = VirtualList(
                 section_frame,
+                make_row=self.create_food_entry_widget,
+                bind_row=self.update_food_entry_widget,
+                row_height=self.FOOD_ROW_HEIGHT,
                 fg_color=("#2b2b2b", "#1a1a1a")
             )
             food_frame.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
             food_frame.grid_columnconfigure(0, weight=1)
             
-            self.meal_sections[meal_type] = food_frame
+            self.meal_sections[meal_type] = food_frame
+
+    def setup_meal_builder(self, parent):
+        """Panel that collects several foods and logs them with a single API call"""
+        self.meal_builder_items = []
+        
+        self.meal_builder_frame = ctk.CTkFrame(parent, fg_color=("#333333", "#252525"))
+        self.meal_builder_frame.grid(row=1, column=0, sticky="ew", padx=5, pady=5)
+        self.meal_builder_frame.grid_columnconfigure(0, weight=1)
+        
+        header_frame = ctk.CTkFrame(self.meal_builder_frame, fg_color="transparent")
+        header_frame.grid(row=0, column=0, sticky="ew", padx=5, pady=5)
+        
+        ctk.CTkLabel(
+            header_frame,
+            text="Meal Builder",
+            font=("Helvetica", 16, "bold")
+        ).pack(side="left", padx=5)
+        
+        self.meal_builder_meal_var = ctk.StringVar(value="Lunch")
+        for meal in ["Breakfast", "Lunch"]:
+            ctk.CTkRadioButton(
+                header_frame,
+                text=meal,
+                variable=self.meal_builder_meal_var,
+                value=meal
+            ).pack(side="left", padx=5)
+        
+        ctk.CTkButton(
+            header_frame,
+            text="Clear",
+            command=self.clear_meal_builder,
+            width=60,
+            font=("Helvetica", 12),
+            fg_color=("#4a4a4a", "#3a3a3a"),
+            hover_color=("#555555", "#444444")
+        ).pack(side="right", padx=5)
+        
+        ctk.CTkButton(
+            header_frame,
+            text="Log Meal",
+            command=self.log_meal_builder,
+            width=80,
+            font=("Helvetica", 12, "bold")
+        ).pack(side="right", padx=5)
+        
+        self.meal_builder_list = ctk.CTkFrame(self.meal_builder_frame, fg_color="transparent")
+        self.meal_builder_list.grid(row=1, column=0, sticky="ew", padx=5, pady=(0, 5))
+        self.meal_builder_list.grid_columnconfigure(0, weight=1)
+        
+        # Only shown once something is queued
+        self.meal_builder_frame.grid_remove()
+
+    def queue_meal_item(self, food_item):
+        """Add a search result to the meal builder"""
+        row = ctk.CTkFrame(self.meal_builder_list, fg_color=("#2b2b2b", "#1a1a1a"))
+        row.pack(fill="x", pady=2)
+        
+        ctk.CTkLabel(
+            row,
+            text=food_item['food_name'].title(),
+            font=("Helvetica", 12)
+        ).pack(side="left", padx=10, pady=5)
+        
+        queued = {'item': food_item, 'quantity_var': ctk.StringVar(value="100"), 'row': row}
+        self.meal_builder_items.append(queued)
+        
+        ctk.CTkButton(
+            row,
+            text="✕",
+            command=lambda: self.remove_meal_item(queued),
+            width=30,
+            font=("Helvetica", 12),
+            fg_color="transparent",
+            hover_color=("#3a3a3a", "#2a2a2a")
+        ).pack(side="right", padx=5)
+        
+        ctk.CTkLabel(row, text="g", font=("Helvetica", 12)).pack(side="right")
+        ctk.CTkEntry(
+            row,
+            textvariable=queued['quantity_var'],
+            width=70
+        ).pack(side="right", padx=5)
+        
+        self.meal_builder_frame.grid()
+
+    def remove_meal_item(self, queued):
+        self.meal_builder_items.remove(queued)
+        queued['row'].destroy()
+        if not self.meal_builder_items:
+            self.meal_builder_frame.grid_remove()
+
+    def clear_meal_builder(self):
+        for queued in self.meal_builder_items:
+            queued['row'].destroy()
+        self.meal_builder_items = []
+        self.meal_builder_frame.grid_remove()
+
+    def log_meal_builder(self):
+        """Resolve every queued food in one batched call and log them together"""
+        if not self.meal_builder_items:
+            return
+        
+        try:
+            quantities = [float(queued['quantity_var'].get()) for queued in self.meal_builder_items]
+        except ValueError:
+            self.show_error("Please enter a valid quantity")
+            return
+        
+        # The builder can change while the lookup runs, log what was queued when Log Meal was clicked
+        queued_items = list(self.meal_builder_items)
+        meal_type = self.meal_builder_meal_var.get()
+        
+        def log_results(results):
+            today = datetime.now().strftime("%Y-%m-%d")
+            not_found = []
+            added_ids = []
+            for queued, quantity, food_data in zip(queued_items, quantities, results):
+                food_item = queued['item']
+                if not food_data:
+                    not_found.append(food_item['food_name'])
+                    continue
+                entry_id = self.food_log.next_id()
+                added_ids.append(entry_id)
+                self.add_food_to_log({
+                    'food': food_item['food_name'],
+                    'quantity': quantity,
+                    'meal': meal_type,
+                    'notes': "",
+                    'calories': round(food_data.get('nf_calories', 0)),
+                    'protein': round(food_data.get('nf_protein', 0)),
+                    'carbs': round(food_data.get('nf_total_carbohydrate', 0)),
+                    'fats': round(food_data.get('nf_total_fat', 0)),
+                    'date': today,
+                    'id': entry_id,
+                    'photo': food_item.get('photo', {})
+                })
+            
+            for queued in queued_items:
+                if queued in self.meal_builder_items:
+                    self.remove_meal_item(queued)
+            self.refresh_food_entries(added_ids)
+            
+            if not_found:
+                self.show_error(f"No nutritional information found for: {', '.join(not_found)}")
+        
+        # Extra clicks on Log Meal join the lookup already running
+        self.submit_task(
+            self.meal_builder_nutrients_async,
+            [(queued['item']['food_name'], quantity) for queued, quantity in zip(queued_items, quantities)],
+            task_type="meal_builder",
+            key=("meal_builder",),
+            on_result=log_results
+        )
+
+    async def meal_builder_nutrients_async(self, items):
+        """Awaitable batched nutrient lookup for the meal builder's (food_name, grams) pairs"""
+        try:
+            return await self.async_nutritionix.get_nutrients_batch(items)
+        except requests.RequestException:
+            raise Exception("Failed to fetch nutritional information")
 
     def setup_workout_section(self, parent):
         # Main container with modern styling
@@ -540,9 +3300,21 @@ Please provide a comprehensive and detailed plan with clear formatting."""
         self.workout_loading_label.pack(side="left", padx=10)
         
         # Generate button with modern styling
+        self.regenerate_button = ctk.CTkButton(
+            header_frame,
+            text="Regenerate",
+            command=lambda: self.generate_workout_plan(force=True),
+            font=("Helvetica", 14),
+            height=40,
+            width=110,
+            fg_color=("#4a4a4a", "#3a3a3a"),
+            hover_color=("#555555", "#444444")
+        )
+        self.regenerate_button.pack(side="right", padx=(0, 10))
+        
         self.generate_button = ctk.CTkButton(
             header_frame,
-            text="Generate New Plan",
+            text="Generate Plan",
             command=self.generate_workout_plan,
             font=("Helvetica", 14, "bold"),
             height=40,
@@ -582,6 +3354,17 @@ Please provide a comprehensive and detailed plan with clear formatting."""
             font=("Helvetica", 24, "bold")
         ).pack(side="left", padx=10)
         
+        ctk.CTkButton(
+            header_frame,
+            text="New Chat",
+            command=self.new_chat,
+            font=("Helvetica", 14),
+            height=32,
+            width=100,
+            fg_color=("#4a4a4a", "#3a3a3a"),
+            hover_color=("#555555", "#444444")
+        ).pack(side="right", padx=10)
+        
         # Chat container
         chat_frame = ctk.CTkFrame(
             ai_frame,
@@ -598,6 +3381,14 @@ Please provide a comprehensive and detailed plan with clear formatting."""
         )
         self.chat_history.pack(fill="both", expand=True, padx=10, pady=10)
         
+        # Pick up the conversation where the last session left off
+        if self.chat_session.summary:
+            self.chat_history.insert("end", "(Earlier messages summarized)\n\n")
+        for turn in self.chat_session.turns:
+            speaker = "\nYou" if turn['role'] == "user" else "AI Coach"
+            self.chat_history.insert("end", f"{speaker}: {turn['text']}\n\n")
+        self.chat_history.see("end")
+        
         # Input area
         input_frame = ctk.CTkFrame(
             ai_frame,
@@ -639,19 +3430,21 @@ Please provide a comprehensive and detailed plan with clear formatting."""
         # Add validation and enter key binding
         self.ai_input.bind("<Return>", lambda e: self.ask_ai_coach())
 
-    @async_api_call
     def ask_ai_coach(self):
-        # Disable the ask button while processing
-        self.ask_button.configure(state="disabled")
+        # The Enter binding still fires while the button is disabled
+        if self.ask_button.cget("state") == "disabled":
+            return
         
         question = self.ai_input.get().strip()
         
         # Validate input
         if not question:
             self.show_error("Please enter a question")
-            self.ask_button.configure(state="normal")
             return
         
+        # Disable the ask button while processing
+        self.ask_button.configure(state="disabled")
+        
         # Add user question to chat history
         self.chat_history.insert("end", f"\nYou: {question}\n\n")
         self.chat_history.see("end")
@@ -659,87 +3452,156 @@ Please provide a comprehensive and detailed plan with clear formatting."""
         # Clear input
         self.ai_input.delete(0, "end")
         
+        # Decided per question: a cached match has to clear the threshold and compatible(), so a
+        # context-dependent follow-up ("and for dinner?") won't find one. Answers are only stored
+        # when no recent turns could have shaped them.
+        standalone = not self.chat_session.in_conversation()
+        cached = self.coach_cache.lookup(question)
+        if cached is not None:
+            answer, similarity = cached
+            print(f"el egaba mawgooda fel cache ({similarity:.2f} similar) - {self.coach_cache.report()}")  # Egyptian Franko
+            self.show_coach_answer(answer)
+            self.chat_session.add_exchange(question, answer)
+            self.summarize_chat()
+            self.ask_button.configure(state="normal")
+            return
+        
+        prompt = self.chat_session.build_prompt(question)
+        streamer = TextStreamer(self.window, self.chat_history, prefix="AI Coach: ", suffix="\n\n")
+        streamer.start()
+        started = time.perf_counter()
+        
+        def answered(answer):
+            if standalone:
+                self.coach_cache.put(question, answer, time.perf_counter() - started)
+            if answer:
+                self.chat_session.add_exchange(question, answer)
+                self.summarize_chat()
+            self.show_coach_answer(answer, streamer)
+        
+        self.coach_task = self.request_coach_answer(
+            prompt,
+            streamer=streamer,
+            on_result=answered
+        )
+        self.coach_task.add_done_callback(streamer.finish)
+        self.coach_task.add_done_callback(lambda: self.ask_button.configure(state="normal"))
+
+    @async_api_call("coach_answer")
+    async def request_coach_answer(self, prompt, streamer):
+        """Ask the model a coaching question, runs on the asyncio loop"""
+        try:
+            return await self.stream_model_response(prompt, streamer)
+        except Exception as e:
+            raise Exception(f"Error getting AI response: {str(e)}")
+
+    def summarize_chat(self):
+        """Fold coach turns that fell out of the context window into the rolling summary"""
+        summary, turns = self.chat_session.overflow()
+        if not turns:
+            return
+        # At most one summary in flight, the next answer picks up whatever is left over
+        self.submit_task(
+            self.summarize_turns_async, summary, turns,
+            task_type="chat_summary",
+            key=("chat_summary",),
+            indicator=False,
+            on_result=lambda new_summary: self.chat_session.fold(turns, new_summary)
+        )
+
+    async def summarize_turns_async(self, summary, turns):
+        """New rolling summary from the model, or a plain extract if it is unavailable"""
         try:
-            # Get AI response
-            response = self.model.generate_content(question)
+            model = await self.get_model_async()
+            response = await model.generate_content_async(self.chat_session.summary_prompt(summary, turns))
             return response.text
-            
         except Exception as e:
-            self.show_error(f"Error getting AI response: {str(e)}")
-            self.ask_button.configure(state="normal")
+            print(f"7asal error fel chat summary, hanekhtasar men gher el model: {str(e)}")  # Egyptian Franko
+            return self.chat_session.fallback_summary(summary, turns)
+
+    def new_chat(self):
+        """Forget the current conversation and start a fresh one"""
+        self.chat_session.clear()
+        self.chat_history.delete("1.0", "end")
 
     def run(self):
         self.window.mainloop()
+        self.scheduler.shutdown()
+        # Persist the hit/miss counters along with the answers
+        self.coach_cache.save()
+        print(self.coach_cache.report())
+        # Everything still queued goes to disk before the process exits
+        self.persistence.close()
+        try:
+            self.async_bridge.submit(self.async_nutritionix.close()).result(timeout=2)
+        except Exception as e:
+            print(f"Error closing async session: {e}")
+        self.async_bridge.shutdown()
 
     def get_food_details(self, item, quantity=1, serving_size="100g", meal="Snack", notes=""):
         """Get detailed nutritional information for a food item"""
-        headers = {
-            "x-app-id": NUTRITIONIX_APP_ID,
-            "x-app-key": NUTRITIONIX_API_KEY,
-            "x-remote-user-id": "0"
-        }
-        
-        data = {
-            "query": f"{quantity} {serving_size} {item['food_name']}"
-        }
-        
         try:
-            response = requests.post(
-                "https://trackapi.nutritionix.com/v2/natural/nutrients",
-                headers=headers,
-                json=data
-            )
+            grams = float(quantity) * float(serving_size.rstrip("g"))
+            food_data = self.nutritionix.get_nutrients(item['food_name'], grams)
             
-            if response.status_code == 200:
-                result = response.json()
-                if 'foods' in result and len(result['foods']) > 0:
-                    food_data = result['foods'][0]
-                    
-                    # Create food entry
-                    food_entry = {
-                        'food': item['food_name'],
-                        'quantity': quantity,
-                        'serving_size': serving_size,
-                        'meal': meal,
-                        'notes': notes,
-                        'calories': round(food_data.get('nf_calories', 0)),
-                        'protein': round(food_data.get('nf_protein', 0)),
-                        'carbs': round(food_data.get('nf_total_carbohydrate', 0)),
-                        'fats': round(food_data.get('nf_total_fat', 0)),
-                        'date': datetime.now().strftime("%Y-%m-%d"),
-                        'id': str(time.time())
-                    }
-                    
-                    # Add to food log
-                    self.add_food_to_log(food_entry)
-                else:
-                    self.show_error("No nutritional information found for this food")
+            if food_data:
+                # Create food entry
+                food_entry = {
+                    'food': item['food_name'],
+                    'quantity': quantity,
+                    'serving_size': serving_size,
+                    'meal': meal,
+                    'notes': notes,
+                    'calories': round(food_data.get('nf_calories', 0)),
+                    'protein': round(food_data.get('nf_protein', 0)),
+                    'carbs': round(food_data.get('nf_total_carbohydrate', 0)),
+                    'fats': round(food_data.get('nf_total_fat', 0)),
+                    'date': datetime.now().strftime("%Y-%m-%d"),
+                    'id': self.food_log.next_id()
+                }
+                
+                # Add to food log
+                self.add_food_to_log(food_entry)
             else:
-                self.show_error("Failed to fetch nutritional information")
+                self.show_error("No nutritional information found for this food")
+        except requests.RequestException:
+            self.show_error("Failed to fetch nutritional information")
         except Exception as e:
             self.show_error(f"Error: {str(e)}")
 
     def load_food_log(self):
-        """Load the food log from file"""
+        """Load the food log from the snapshot and journal"""
         try:
-            with open("food_log.json", "r") as f:
-                log = json.load(f)
-                print(f"Loaded {len(log)} entries from food log")
-                return log
-        except FileNotFoundError:
-            print("mesh la2y el food log file, ha3mel wa7ed gedid")
-            return []
+            log = FoodLogIndex(self.food_store.load())
+            if not log:
+                print("mesh la2y el food log file, ha3mel wa7ed gedid")
+            print(f"Loaded {len(log)} entries from food log")
+            archived = self.archive_old_entries(log)
+            # Old entries without ids just got one, write them out so journal records can refer to them.
+            # Archived entries only leave the hot snapshot once it is rewritten without them.
+            if log.assigned_ids or archived or self.food_store.needs_compaction():
+                self.food_store.compact(log)
+            return log
         except Exception as e:
             print(f"7asal error fel loading bta3 el food log: {str(e)}")
-            return []
+            return FoodLogIndex()
+
+    def archive_old_entries(self, log):
+        """Hand entries older than the hot window to the store's archives and drop them from memory"""
+        cutoff = self.food_store.hot_cutoff()
+        cold = [entry for entry in log if entry.get('date') and entry['date'] < cutoff]
+        if not cold:
+            return 0
+        archived = self.food_store.archive(cold)
+        for entry_id in archived:
+            log.remove(entry_id)
+        print(f"Archived {len(archived)} entries from before {cutoff}")
+        return len(archived)
 
     def load_user_profile(self):
-        """Load the user profile from file"""
+        """The user profile, read from disk once and then served from memory"""
         try:
-            with open("user_profile.json", "r") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}  # Return empty dict if file doesn't exist yet
+            return self.profile_store.get()
         except json.JSONDecodeError:
             self.show_error("Error reading user profile file")
             return {}
@@ -768,12 +3630,24 @@ Please provide a comprehensive and detailed plan with clear formatting."""
 
     def get_todays_log(self):
         today = datetime.now().strftime("%Y-%m-%d")
-        todays_entries = [entry for entry in self.food_log if isinstance(entry, dict) and entry.get('date') == today]
+        todays_entries = self.food_log.for_date(today)
         print(f"3adad el entries el naharda: {len(todays_entries)}")
         for entry in todays_entries:
             print(f"Entry: {entry.get('food')} - Calories: {entry.get('calories')} - Protein: {entry.get('protein')}")
         return todays_entries
 
+    def get_log_range(self, start_date, end_date):
+        """Get entries logged between start_date and end_date (inclusive, YYYY-MM-DD)"""
+        if self.food_store.supports_queries:
+            return self.food_store.entries_in_range(start_date, end_date)
+        entries = self.food_log.in_range(start_date, end_date)
+        if start_date < self.food_store.hot_cutoff():
+            # Reaches back past the hot segment, pull in just the archived months it covers
+            hot_ids = {entry.get('id') for entry in entries}
+            archived = [entry for entry in self.food_store.archived_in_range(start_date, end_date) if entry.get('id') not in hot_ids]
+            entries = archived + entries
+        return entries
+
     def search_food(self):
         """Search for food items using Nutritionix API"""
         query = self.search_entry.get().strip()
@@ -782,25 +3656,19 @@ Please provide a comprehensive and detailed plan with clear formatting."""
             self.show_error("Please enter a food item to search")
             return
         
-        headers = {
-            "x-app-id": NUTRITIONIX_APP_ID,
-            "x-app-key": NUTRITIONIX_API_KEY,
-            "x-remote-user-id": "0"
-        }
-        
+        self.submit_task(
+            self.search_food_async, query,
+            task_type="search_results",
+            key=("search_results", SearchCache.normalize(query)),
+            on_result=lambda results: self.display_search_results(results.get('common', []))
+        )
+
+    async def search_food_async(self, query):
+        """Awaitable food search, returns the instant search response"""
         try:
-            response = requests.get(
-                f"https://trackapi.nutritionix.com/v2/search/instant?query={query}",
-                headers=headers
-            )
-            
-            if response.status_code == 200:
-                results = response.json()
-                self.display_search_results(results.get('common', []))
-            else:
-                self.show_error("Failed to fetch food items")
-        except Exception as e:
-            self.show_error(f"Error: {str(e)}")
+            return await self.async_nutritionix.search(query)
+        except requests.RequestException:
+            raise Exception("Failed to fetch food items")
 
     def display_search_results(self, results):
         """Display search results in a popup window"""
@@ -809,64 +3677,92 @@ Please provide a comprehensive and detailed plan with clear formatting."""
         popup.title("Search Results")
         popup.geometry("600x400")
         
-        # Create scrollable frame for results
-        results_frame = ctk.CTkScrollableFrame(
+        # Only the visible results get row widgets, so there's no need to cut the list short
+        results_list = VirtualList(
             popup,
+            make_row=self.create_search_result_row,
+            bind_row=self.bind_search_result_row,
+            row_height=self.SEARCH_ROW_HEIGHT,
             fg_color=("#2b2b2b", "#1a1a1a")
         )
-        results_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        results_list.pack(fill="both", expand=True, padx=10, pady=10)
+        results_list.set_items(list(enumerate(results)))
+
+    def create_search_result_row(self, parent):
+        """Build one empty, recyclable search result row"""
+        row = {'item': None, 'thumb_url': None}
         
-        for item in results[:10]:  # Limit to 10 results
-            # Create frame for each food item
-            item_frame = ctk.CTkFrame(
-                results_frame,
-                fg_color=("#333333", "#252525")
-            )
-            item_frame.pack(fill="x", padx=5, pady=2)
-            
-            # Try to get food image
-            try:
-                image_url = item.get('photo', {}).get('thumb', None)
-                if image_url:
-                    response = requests.get(image_url)
-                    img = Image.open(BytesIO(response.content))
-                    img = img.resize((50, 50), Image.Resampling.LANCZOS)
-                    # Convert to CTkImage
-                    ctk_image = ctk.CTkImage(light_image=img, dark_image=img, size=(50, 50))
-                    
-                    img_label = ctk.CTkLabel(
-                        item_frame,
-                        image=ctk_image,
-                        text=""
-                    )
-                    img_label.pack(side="left", padx=5, pady=5)
-            except Exception as e:
-                print(f"Error loading image: {e}")
-            
-            # Food name
-            ctk.CTkLabel(
-                item_frame,
-                text=item['food_name'].title(),
-                font=("Helvetica", 14)
-            ).pack(side="left", padx=10, pady=5)
-            
-            # Add food button
-            ctk.CTkButton(
-                item_frame,
-                text="Add",
-                command=lambda i=item: self.show_add_food_dialog(i),
-                width=60,
-                font=("Helvetica", 12)
-            ).pack(side="right", padx=10, pady=5)
-            
-            # View details button
-            ctk.CTkButton(
-                item_frame,
-                text="Details",
-                command=lambda i=item: self.show_food_details(i),
-                width=60,
-                font=("Helvetica", 12)
-            ).pack(side="right", padx=10, pady=5)
+        item_frame = ctk.CTkFrame(
+            parent,
+            height=self.SEARCH_ROW_HEIGHT - 4,
+            fg_color=("#333333", "#252525")
+        )
+        item_frame.pack_propagate(False)
+        row['frame'] = item_frame
+        
+        # Placeholder now, the photo is swapped in when it arrives
+        row['thumb'] = self.create_thumbnail_placeholder(item_frame, (50, 50))
+        row['thumb'].pack(side="left", padx=5, pady=5)
+        
+        # Food name
+        row['name'] = ctk.CTkLabel(
+            item_frame,
+            text="",
+            font=("Helvetica", 14)
+        )
+        row['name'].pack(side="left", padx=10, pady=5)
+        
+        # Add food button
+        ctk.CTkButton(
+            item_frame,
+            text="Add",
+            command=lambda: self.show_add_food_dialog(row['item']),
+            width=60,
+            font=("Helvetica", 12)
+        ).pack(side="right", padx=10, pady=5)
+        
+        # Queue for the meal builder
+        ctk.CTkButton(
+            item_frame,
+            text="+ Meal",
+            command=lambda: self.queue_meal_item(row['item']),
+            width=60,
+            font=("Helvetica", 12)
+        ).pack(side="right", padx=10, pady=5)
+        
+        # View details button
+        ctk.CTkButton(
+            item_frame,
+            text="Details",
+            command=lambda: self.show_food_details(row['item']),
+            width=60,
+            font=("Helvetica", 12)
+        ).pack(side="right", padx=10, pady=5)
+        
+        return row
+
+    def bind_search_result_row(self, row, item):
+        row['item'] = item
+        row['name'].configure(text=item['food_name'].title())
+        self.bind_thumbnail(row, (item.get('photo') or {}).get('thumb'), (50, 50))
+
+    def create_thumbnail_placeholder(self, parent, size):
+        """Empty tile the size of a thumbnail, shown until the photo loads"""
+        return ctk.CTkLabel(
+            parent,
+            text="",
+            width=size[0],
+            height=size[1],
+            fg_color=("#444444", "#333333"),
+            corner_radius=6
+        )
+
+    def load_thumbnail(self, label, image_url, size):
+        """Fill a placeholder label with the thumbnail once it has loaded"""
+        def show(image):
+            if label.winfo_exists():
+                label.configure(image=image, fg_color="transparent")
+        self.image_cache.get_async(image_url, size, show)
 
     def show_add_food_dialog(self, food_item):
         """Show dialog to add food with quantity and meal type"""
@@ -946,73 +3842,77 @@ Please provide a comprehensive and detailed plan with clear formatting."""
         """Add food item to the log"""
         try:
             quantity = float(quantity)
+        except ValueError:
+            self.show_error("Please enter a valid quantity")
+            return
+        
+        def add_entry(food_entry):
+            if food_entry is None:
+                self.show_error("No nutritional information found for this food")
+                return
             
-            # Get nutritional info
-            headers = {
-                "x-app-id": NUTRITIONIX_APP_ID,
-                "x-app-key": NUTRITIONIX_API_KEY,
-                "x-remote-user-id": "0"
-            }
-            
-            data = {
-                "query": f"{quantity}g {food_item['food_name']}"
-            }
-            
-            response = requests.post(
-                "https://trackapi.nutritionix.com/v2/natural/nutrients",
-                headers=headers,
-                json=data
-            )
+            # Add to food log
+            self.add_food_to_log(food_entry)
             
-            if response.status_code == 200:
-                result = response.json()
-                if 'foods' in result and len(result['foods']) > 0:
-                    food_data = result['foods'][0]
-                    
-                    # Create food entry with all required fields
-                    food_entry = {
-                        'food': food_item['food_name'],
-                        'quantity': quantity,  # Make sure quantity is included
-                        'meal': meal_type,
-                        'notes': notes,
-                        'calories': round(food_data.get('nf_calories', 0)),
-                        'protein': round(food_data.get('nf_protein', 0)),
-                        'carbs': round(food_data.get('nf_total_carbohydrate', 0)),
-                        'fats': round(food_data.get('nf_total_fat', 0)),
-                        'date': datetime.now().strftime("%Y-%m-%d"),
-                        'id': str(time.time()),
-                        'photo': food_item.get('photo', {})
-                    }
-                    
-                    # Add to food log
-                    if not hasattr(self, 'food_log'):
-                        self.food_log = []
-                    self.food_log.append(food_entry)
-                    self.save_food_log()
-                    
-                    # Close dialog
-                    dialog.destroy()
-                    
-                    # Refresh food log display
-                    self.refresh_food_log()
-                else:
-                    self.show_error("No nutritional information found for this food")
-            else:
-                self.show_error("Failed to fetch nutritional information")
+            # Close dialog
+            dialog.destroy()
             
-        except ValueError:
-            self.show_error("Please enter a valid quantity")
-        except Exception as e:
-            print(f"7asal error fel adding: {str(e)}")
-            self.show_error(f"Error: {str(e)}")
+            # Show just the new row
+            self.refresh_food_entries([food_entry['id']])
+        
+        # One lookup per dialog, extra clicks on Add Food join it
+        self.submit_task(
+            self.add_food_item_async, food_item, quantity, meal_type, notes,
+            task_type="add_food",
+            key=("add_food", str(dialog)),
+            on_result=add_entry
+        )
+
+    async def add_food_item_async(self, food_item, quantity, meal_type, notes):
+        """Awaitable nutrient lookup for a new entry
+
+        Returns the entry ready for add_food_to_log, or None if the food isn't recognised.
+        """
+        try:
+            # Get nutritional info, scaled locally for foods we've seen before
+            food_data = await self.async_nutritionix.get_nutrients(food_item['food_name'], quantity)
+        except requests.RequestException:
+            raise Exception("Failed to fetch nutritional information")
+        
+        if not food_data:
+            return None
+        
+        # Create food entry with all required fields
+        return {
+            'food': food_item['food_name'],
+            'quantity': quantity,  # Make sure quantity is included
+            'meal': meal_type,
+            'notes': notes,
+            'calories': round(food_data.get('nf_calories', 0)),
+            'protein': round(food_data.get('nf_protein', 0)),
+            'carbs': round(food_data.get('nf_total_carbohydrate', 0)),
+            'fats': round(food_data.get('nf_total_fat', 0)),
+            'date': datetime.now().strftime("%Y-%m-%d"),
+            'id': self.food_log.next_id(),
+            'photo': food_item.get('photo', {})
+        }
+
+    def add_food_to_log(self, food_entry):
+        """Append a new entry to the food log and journal it"""
+        if not hasattr(self, 'food_log'):
+            self.food_log = FoodLogIndex()
+        self.food_log.add(food_entry)
+        self.food_store.record_add(food_entry)
+        self.maybe_compact_food_log()
 
     def delete_food_entry(self, entry):
         """Delete a food entry from the log"""
         if 'id' in entry:
-            self.food_log = [e for e in self.food_log if e.get('id') != entry['id']]
-            self.save_food_log()
+            self.food_log.remove(entry['id'])
+            self.food_store.record_delete(entry['id'])
+            self.maybe_compact_food_log()
             print(f"keda mesa7t el entry bta3 {entry.get('food', 'unknown')} men el food log")
-            self.refresh_food_log()
+            self.refresh_food_entries([entry['id']])
 
     def show_edit_food_dialog(self, entry):
         """Show dialog to edit food entry"""
@@ -1093,178 +3993,237 @@ Please provide a comprehensive and detailed plan with clear formatting."""
         """Update an existing food entry"""
         try:
             quantity = float(quantity)
-            
-            # Get nutritional info
-            headers = {
-                "x-app-id": NUTRITIONIX_APP_ID,
-                "x-app-key": NUTRITIONIX_API_KEY,
-                "x-remote-user-id": "0"
-            }
-            
-            data = {
-                "query": f"{quantity}g {old_entry['food']}"
-            }
-            
-            response = requests.post(
-                "https://trackapi.nutritionix.com/v2/natural/nutrients",
-                headers=headers,
-                json=data
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if 'foods' in result and len(result['foods']) > 0:
-                    food_data = result['foods'][0]
-                    
-                    # Update entry
-                    for entry in self.food_log:
-                        if entry.get('id') == old_entry['id']:
-                            entry.update({
-                                'quantity': quantity,
-                                'meal': meal_type,
-                                'notes': notes,
-                                'calories': round(food_data.get('nf_calories', 0)),
-                                'protein': round(food_data.get('nf_protein', 0)),
-                                'carbs': round(food_data.get('nf_total_carbohydrate', 0)),
-                                'fats': round(food_data.get('nf_total_fat', 0))
-                            })
-                            break
-                    
-                    self.save_food_log()
-                    dialog.destroy()
-                    self.refresh_food_log()
-                else:
-                    self.show_error("No nutritional information found for this food")
-            else:
-                self.show_error("Failed to fetch nutritional information")
-            
         except ValueError:
             self.show_error("Please enter a valid quantity")
-        except Exception as e:
-            print(f"7asal error fel updating: {str(e)}")
-            self.show_error(f"Error: {str(e)}")
+            return
+        
+        entry_id = old_entry['id']
+        
+        def apply_update(food_data):
+            if not food_data:
+                self.show_error("No nutritional information found for this food")
+                return
+            if entry_id not in self.food_log:
+                # Deleted while the lookup was running
+                return
+            fields = {
+                'quantity': quantity,
+                'meal': meal_type,
+                'notes': notes,
+                'calories': round(food_data.get('nf_calories', 0)),
+                'protein': round(food_data.get('nf_protein', 0)),
+                'carbs': round(food_data.get('nf_total_carbohydrate', 0)),
+                'fats': round(food_data.get('nf_total_fat', 0))
+            }
+            self.food_log.update(entry_id, fields)
+            
+            self.food_store.record_update(entry_id, fields)
+            self.maybe_compact_food_log()
+            if dialog.winfo_exists():
+                dialog.destroy()
+            self.refresh_food_entries([entry_id])
+        
+        # Macros scale linearly, so a quantity change is usually computed from the cache
+        self.submit_task(
+            self.update_food_entry_async, old_entry['food'], quantity,
+            task_type="update_food",
+            key=("update_food", str(dialog)),
+            on_result=apply_update
+        )
+
+    async def update_food_entry_async(self, food_name, quantity):
+        """Awaitable nutrients for the edited quantity, None if the food isn't recognised"""
+        try:
+            return await self.async_nutritionix.get_nutrients(food_name, quantity)
+        except requests.RequestException:
+            raise Exception("Failed to fetch nutritional information")
 
     def save_food_log(self):
-        """Save the food log to file"""
+        """Write a full snapshot of the food log and reset the journal, the write itself happens behind the UI"""
         try:
-            with open("food_log.json", "w") as f:
-                json.dump(self.food_log, f)
+            self.food_store.compact(self.food_log)
         except Exception as e:
             self.show_error(f"Error saving food log: {str(e)}")
 
+    def maybe_compact_food_log(self):
+        """Fold the journal into a new snapshot in the background once it grows long"""
+        try:
+            if self.food_store.needs_compaction():
+                self.food_store.compact(self.food_log)
+        except Exception as e:
+            print(f"7asal error fel compaction bta3 el food log: {str(e)}")
+
     def refresh_food_log(self):
-        """Refresh the food log display"""
-        for section in self.meal_sections.values():
-            for widget in section.winfo_children():
-                widget.destroy()
+        """Reload every meal list from today's entries, keyed by entry id"""
+        by_meal = {meal_type: [] for meal_type in self.meal_sections}
+        self.entry_rows = {}
+        for entry in self.get_todays_log():
+            meal_type = entry.get('meal', 'Lunch')
+            if meal_type in by_meal:
+                by_meal[meal_type].append((entry['id'], entry))
+                self.entry_rows[entry['id']] = meal_type
         
-        todays_log = self.get_todays_log()
-        meal_calories = {"Breakfast": 0, "Lunch": 0}
+        # Only the visible rows are bound, however long the lists are
+        for meal_type, items in by_meal.items():
+            self.meal_sections[meal_type].set_items(items)
         
-        for entry in todays_log:
-            meal_type = entry.get('meal', 'Lunch')
-            if meal_type in self.meal_sections:
-                self.create_food_entry_widget(self.meal_sections[meal_type], entry)
-                try:
-                    calories = float(entry.get('calories', 0))
-                    meal_calories[meal_type] += calories
-                except (ValueError, TypeError):
-                    print(f"Error converting calories for entry: {entry}")
+        self.update_food_log_totals()
+
+    def refresh_food_entries(self, entry_ids):
+        """Re-render only the rows for entries that were just added, edited or deleted"""
+        for entry_id in entry_ids:
+            self.render_food_entry(entry_id)
+        self.update_food_log_totals()
+
+    def update_food_log_totals(self):
+        """Meal calorie labels and progress bars, read from the index's running totals"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        for meal_type, label in self.meal_calories_labels.items():
+            calories = self.food_log.totals_for_meal(today, meal_type)['calories']
+            label.configure(text=f"{int(calories)} kcal")
         
-        for meal_type, calories in meal_calories.items():
-            if meal_type in self.meal_calories_labels:
-                self.meal_calories_labels[meal_type].configure(text=f"{int(calories)} kcal")
+        self.update_macro_progress_bars()
+
+    def render_food_entry(self, entry_id):
+        """Add, update, move or remove one entry in the meal lists so they match the food log"""
+        entry = self.food_log.get(entry_id)
+        shown_in = self.entry_rows.get(entry_id)
+        today = datetime.now().strftime("%Y-%m-%d")
+        meal_type = entry.get('meal', 'Lunch') if entry is not None else None
         
-        self.create_macro_progress_bars(self.left_frame)
+        if entry is None or entry.get('date') != today or meal_type not in self.meal_sections:
+            if shown_in is not None:
+                self.remove_food_entry_row(entry_id)
+            return
+        
+        if shown_in is not None and shown_in != meal_type:
+            # Moved to another meal
+            self.remove_food_entry_row(entry_id)
+        
+        self.meal_sections[meal_type].upsert(entry_id, entry)
+        self.entry_rows[entry_id] = meal_type
 
-    def create_food_entry_widget(self, parent, entry):
-        """Create a widget for a food entry"""
-        try:
-            entry_frame = ctk.CTkFrame(
-                parent,
-                fg_color=("#333333", "#252525")
-            )
-            entry_frame.pack(fill="x", padx=5, pady=2)
-            entry_frame.grid_columnconfigure(1, weight=1)  # Make food info expandable
-            
-            # Try to get food image
-            try:
-                if 'photo' in entry:
-                    image_url = entry['photo'].get('thumb', None)
-                    if image_url:
-                        response = requests.get(image_url)
-                        img = Image.open(BytesIO(response.content))
-                        img = img.resize((40, 40), Image.Resampling.LANCZOS)
-                        ctk_image = ctk.CTkImage(light_image=img, dark_image=img, size=(40, 40))
-                        
-                        img_label = ctk.CTkLabel(
-                            entry_frame,
-                            image=ctk_image,
-                            text=""
-                        )
-                        img_label.grid(row=0, column=0, rowspan=2, padx=5, pady=5)
-            except Exception as e:
-                print(f"Error loading image: {e}")
-            
-            # Food info (name, quantity, calories)
-            info_frame = ctk.CTkFrame(entry_frame, fg_color="transparent")
-            info_frame.grid(row=0, column=1, sticky="ew", padx=5)
-            info_frame.grid_columnconfigure(0, weight=1)
-            
-            # Food name
-            food_name = entry.get('food', 'Unknown Food')
-            ctk.CTkLabel(
-                info_frame,
-                text=food_name,
-                font=("Helvetica", 12, "bold")
-            ).grid(row=0, column=0, sticky="w")
-            
-            # Quantity (with fallback)
-            quantity = entry.get('quantity', 0)
-            ctk.CTkLabel(
-                info_frame,
-                text=f"{quantity}g",
-                font=("Helvetica", 12)
-            ).grid(row=1, column=0, sticky="w")
-            
-            # Calories (if available)
-            calories = entry.get('calories', 0)
-            if calories:
-                ctk.CTkLabel(
-                    info_frame,
-                    text=f"{calories} kcal",
-                    font=("Helvetica", 12)
-                ).grid(row=0, column=1, sticky="e", padx=5)
-            
-            # Buttons frame
-            buttons_frame = ctk.CTkFrame(entry_frame, fg_color="transparent")
-            buttons_frame.grid(row=0, column=2, padx=5, pady=5)
-            
-            # Edit button
-            ctk.CTkButton(
-                buttons_frame,
-                text="Edit",
-                command=lambda: self.show_edit_food_dialog(entry),
-                width=60,
-                height=30,
-                font=("Helvetica", 12)
-            ).grid(row=0, column=0, padx=2)
-            
-            # Delete button
-            ctk.CTkButton(
-                buttons_frame,
-                text="Delete",
-                command=lambda: self.delete_food_entry(entry),
-                width=60,
-                height=30,
-                font=("Helvetica", 12),
-                fg_color="red",
-                hover_color="#aa0000"
-            ).grid(row=0, column=1, padx=2)
-            
-        except Exception as e:
-            print(f"Error creating food entry widget: {e}")
-            self.show_error(f"Error displaying food entry: {str(e)}")
+    def remove_food_entry_row(self, entry_id):
+        meal_type = self.entry_rows.pop(entry_id, None)
+        if meal_type is not None:
+            self.meal_sections[meal_type].remove(entry_id)
+
+    def create_food_entry_widget(self, parent):
+        """Build one empty, recyclable food log row, update_food_entry_widget binds it to an entry"""
+        row = {'entry_id': None, 'thumb_url': None, 'shown': None}
+        
+        entry_frame = ctk.CTkFrame(
+            parent,
+            height=self.FOOD_ROW_HEIGHT - 4,
+            fg_color=("#333333", "#252525")
+        )
+        # Fixed height, the list places rows at fixed offsets
+        entry_frame.grid_propagate(False)
+        entry_frame.grid_columnconfigure(1, weight=1)  # Make food info expandable
+        row['frame'] = entry_frame
+        
+        row['thumb'] = self.create_thumbnail_placeholder(entry_frame, (40, 40))
+        row['thumb'].grid(row=0, column=0, rowspan=2, padx=5, pady=5)
+        
+        # Food info (name, quantity, calories)
+        info_frame = ctk.CTkFrame(entry_frame, fg_color="transparent")
+        info_frame.grid(row=0, column=1, sticky="ew", padx=5)
+        info_frame.grid_columnconfigure(0, weight=1)
+        
+        row['name'] = ctk.CTkLabel(
+            info_frame,
+            text="",
+            height=20,
+            font=("Helvetica", 12, "bold")
+        )
+        row['name'].grid(row=0, column=0, sticky="w")
+        
+        row['quantity'] = ctk.CTkLabel(
+            info_frame,
+            text="",
+            height=20,
+            font=("Helvetica", 12)
+        )
+        row['quantity'].grid(row=1, column=0, sticky="w")
+        
+        row['calories'] = ctk.CTkLabel(
+            info_frame,
+            text="",
+            height=20,
+            font=("Helvetica", 12)
+        )
+        row['calories'].grid(row=0, column=1, sticky="e", padx=5)
+        
+        # Buttons frame
+        buttons_frame = ctk.CTkFrame(entry_frame, fg_color="transparent")
+        buttons_frame.grid(row=0, column=2, padx=5, pady=5)
+        
+        # Rows are recycled, so the buttons act on whichever entry is bound right now
+        ctk.CTkButton(
+            buttons_frame,
+            text="Edit",
+            command=lambda: self.food_row_action(row, self.show_edit_food_dialog),
+            width=60,
+            height=30,
+            font=("Helvetica", 12)
+        ).grid(row=0, column=0, padx=2)
+        
+        ctk.CTkButton(
+            buttons_frame,
+            text="Delete",
+            command=lambda: self.food_row_action(row, self.delete_food_entry),
+            width=60,
+            height=30,
+            font=("Helvetica", 12),
+            fg_color="red",
+            hover_color="#aa0000"
+        ).grid(row=0, column=1, padx=2)
+        
+        return row
+
+    def food_row_action(self, row, action):
+        """Run action on the entry a row shows, or just redraw if that entry is already gone"""
+        entry = self.food_log.get(row['entry_id']) if row['entry_id'] is not None else None
+        if entry is None:
+            # Double click on Delete, or a row left over from before a refresh
+            self.refresh_food_log()
+            return
+        action(entry)
+
+    def update_food_entry_widget(self, row, entry):
+        """Bind a row to an entry, touching only the labels whose text changed"""
+        row['entry_id'] = entry['id']
+        calories = entry.get('calories', 0)
+        shown = (
+            entry.get('food', 'Unknown Food'),
+            f"{entry.get('quantity', 0)}g",
+            f"{calories} kcal" if calories else ""
+        )
+        previous = row['shown'] or (None, None, None)
+        for widget, text, old_text in zip((row['name'], row['quantity'], row['calories']), shown, previous):
+            if text != old_text:
+                widget.configure(text=text)
+        row['shown'] = shown
+        
+        image_url = (entry.get('photo') or {}).get('thumb')
+        self.bind_thumbnail(row, image_url, (40, 40))
+
+    def bind_thumbnail(self, row, image_url, size):
+        """Point a recycled row's thumbnail at image_url, ignoring photos for entries it no longer shows"""
+        if row['thumb_url'] == image_url:
+            return
+        row['thumb_url'] = image_url
+        row['thumb'].configure(
+            image=self.image_cache.blank(size),
+            fg_color=("#444444", "#333333") if image_url else "transparent"
+        )
+        if not image_url:
+            return
+        
+        def show(image):
+            if row['thumb_url'] == image_url and row['thumb'].winfo_exists():
+                row['thumb'].configure(image=image, fg_color="transparent")
+        self.image_cache.get_async(image_url, size, show)
 
     def show_error(self, message):
         """Display error message in a popup"""
@@ -1321,46 +4280,51 @@ Please provide a comprehensive and detailed plan with clear formatting."""
             'activity_level': profile.get('activity_level', 'Moderate')
         }
 
-    def handle_api_result(self, result):
-        """Handle results from async API calls"""
+    def handle_api_result(self, handle, result):
+        """Route a finished task's result to the callback for its task type"""
+        handler = handle.on_result or self.result_handlers.get(handle.task_type)
+        if handler is None:
+            print(f"No handler for {handle.task_type} result")
+            return
+        handler(result)
+
+    def show_workout_plan(self, result, streamer=None, cache_key=None, user_stats=None):
+        """Display and save a workout plan, caching it under cache_key if it was just generated"""
         if not result:
             return
-        
-        # Handle workout plan generation result
-        if isinstance(result, str) and "workout plan" in result.lower():
-            try:
-                print("el workout plan geh ya m3alem:", result)  # Egyptian Franko
-                
-                if hasattr(self, 'workout_text'):
-                    self.workout_text.delete("1.0", "end")
-                    self.workout_text.insert("1.0", result)
-                    self.workout_text.see("1.0")
-                else:
-                    print("mesh la2y el workout_text widget ya basha")  # Egyptian Franko
-                
-                self.save_workout_plan(result)
-                
-            except Exception as e:
-                print(f"7asal error fel workout plan ya ray2: {str(e)}")  # Egyptian Franko
-                self.show_error(f"Error processing workout plan: {str(e)}")
-            finally:
-                if hasattr(self, 'generate_button'):
-                    self.generate_button.configure(state="normal")
-        
-        # Handle AI coach responses
-        elif isinstance(result, str):
-            if hasattr(self, 'chat_history'):
-                self.chat_history.insert("end", f"AI Coach: {result}\n\n")
-                self.chat_history.see("end")
-                # Re-enable the ask button
-                if hasattr(self, 'ask_button'):
-                    self.ask_button.configure(state="normal")
+        try:
+            print("el workout plan geh ya m3alem:", result)  # Egyptian Franko
+            
+            if streamer is not None and streamer.received:
+                # Already on screen, chunk by chunk
+                self.workout_text.see("1.0")
+            elif hasattr(self, 'workout_text'):
+                self.workout_text.delete("1.0", "end")
+                self.workout_text.insert("1.0", result)
+                self.workout_text.see("1.0")
+            else:
+                print("mesh la2y el workout_text widget ya basha")  # Egyptian Franko
+            
+            self.save_workout_plan(result)
+            if cache_key is not None:
+                self.workout_plan_cache.put(cache_key, result, user_stats)
+            
+        except Exception as e:
+            print(f"7asal error fel workout plan ya ray2: {str(e)}")  # Egyptian Franko
+            self.show_error(f"Error processing workout plan: {str(e)}")
+
+    def show_coach_answer(self, result, streamer=None):
+        """Append an AI coach answer to the chat, unless it was already streamed in"""
+        if streamer is not None and streamer.received:
+            return
+        if result and hasattr(self, 'chat_history'):
+            self.chat_history.insert("end", f"AI Coach: {result}\n\n")
+            self.chat_history.see("end")
 
     def save_workout_plan(self, plan):
-        """Save the workout plan to file"""
+        """Save the workout plan to file, written behind the UI"""
         try:
-            with open("workout_plan.json", "w") as f:
-                json.dump({"plan": plan}, f)
+            save_json("workout_plan.json", {"plan": plan}, self.persistence)
         except Exception as e:
             self.show_error(f"Error saving workout plan: {str(e)}")
 
@@ -1379,17 +4343,9 @@ Please provide a comprehensive and detailed plan with clear formatting."""
         try:
             image_url = food_item.get('photo', {}).get('thumb', None)
             if image_url:
-                response = requests.get(image_url)
-                img = Image.open(BytesIO(response.content))
-                img = img.resize((100, 100), Image.Resampling.LANCZOS)
-                ctk_image = ctk.CTkImage(light_image=img, dark_image=img, size=(100, 100))
-                
-                img_label = ctk.CTkLabel(
-                    details_frame,
-                    image=ctk_image,
-                    text=""
-                )
+                img_label = self.create_thumbnail_placeholder(details_frame, (100, 100))
                 img_label.pack(pady=10)
+                self.load_thumbnail(img_label, image_url, (100, 100))
         except Exception as e:
             print(f"Error loading image: {e}")
         
@@ -1399,62 +4355,56 @@ Please provide a comprehensive and detailed plan with clear formatting."""
             font=("Helvetica", 20, "bold")
         ).pack(pady=10)
         
-        headers = {
-            "x-app-id": NUTRITIONIX_APP_ID,
-            "x-app-key": NUTRITIONIX_API_KEY,
-            "x-remote-user-id": "0"
-        }
+        # Nutrient rows fill in when the lookup finishes
+        self.submit_task(
+            self.food_details_async, food_item,
+            task_type="food_details",
+            on_result=lambda food_data: self.show_food_detail_rows(details_frame, food_data)
+        )
+
+    async def food_details_async(self, food_item):
+        """Awaitable nutrients for 100g of a food, None if it isn't recognised"""
+        try:
+            return await self.async_nutritionix.get_nutrients(food_item['food_name'], 100)
+        except requests.RequestException as e:
+            raise Exception(f"Error fetching nutritional information: {str(e)}")
+
+    def show_food_detail_rows(self, details_frame, food_data):
+        """Fill the details dialog once the nutrients have arrived"""
+        if not food_data or not details_frame.winfo_exists():
+            return
         
-        data = {
-            "query": f"100g {food_item['food_name']}"
-        }
+        info_items = [
+            ("Serving Size", "100g"),
+            ("Calories", f"{round(food_data.get('nf_calories', 0))} kcal"),
+            ("Protein", f"{round(food_data.get('nf_protein', 0))}g"),
+            ("Total Carbs", f"{round(food_data.get('nf_total_carbohydrate', 0))}g"),
+            ("Total Fat", f"{round(food_data.get('nf_total_fat', 0))}g"),
+            ("Saturated Fat", f"{round(food_data.get('nf_saturated_fat', 0))}g"),
+            ("Cholesterol", f"{round(food_data.get('nf_cholesterol', 0))}mg"),
+            ("Sodium", f"{round(food_data.get('nf_sodium', 0))}mg"),
+            ("Fiber", f"{round(food_data.get('nf_dietary_fiber', 0))}g"),
+            ("Sugars", f"{round(food_data.get('nf_sugars', 0))}g")
+        ]
         
-        try:
-            response = requests.post(
-                "https://trackapi.nutritionix.com/v2/natural/nutrients",
-                headers=headers,
-                json=data
+        for label, value in info_items:
+            row = ctk.CTkFrame(
+                details_frame,
+                fg_color=("#333333", "#252525")
             )
+            row.pack(fill="x", padx=10, pady=2)
             
-            if response.status_code == 200:
-                result = response.json()
-                if 'foods' in result and len(result['foods']) > 0:
-                    food_data = result['foods'][0]
-                    
-                    info_items = [
-                        ("Serving Size", "100g"),
-                        ("Calories", f"{round(food_data.get('nf_calories', 0))} kcal"),
-                        ("Protein", f"{round(food_data.get('nf_protein', 0))}g"),
-                        ("Total Carbs", f"{round(food_data.get('nf_total_carbohydrate', 0))}g"),
-                        ("Total Fat", f"{round(food_data.get('nf_total_fat', 0))}g"),
-                        ("Saturated Fat", f"{round(food_data.get('nf_saturated_fat', 0))}g"),
-                        ("Cholesterol", f"{round(food_data.get('nf_cholesterol', 0))}mg"),
-                        ("Sodium", f"{round(food_data.get('nf_sodium', 0))}mg"),
-                        ("Fiber", f"{round(food_data.get('nf_dietary_fiber', 0))}g"),
-                        ("Sugars", f"{round(food_data.get('nf_sugars', 0))}g")
-                    ]
-                    
-                    for label, value in info_items:
-                        row = ctk.CTkFrame(
-                            details_frame,
-                            fg_color=("#333333", "#252525")
-                        )
-                        row.pack(fill="x", padx=10, pady=2)
-                        
-                        ctk.CTkLabel(
-                            row,
-                            text=label,
-                            font=("Helvetica", 14)
-                        ).pack(side="left", padx=10, pady=5)
-                        
-                        ctk.CTkLabel(
-                            row,
-                            text=value,
-                            font=("Helvetica", 14, "bold")
-                        ).pack(side="right", padx=10, pady=5)
-                
-        except Exception as e:
-            self.show_error(f"Error fetching nutritional information: {str(e)}")
+            ctk.CTkLabel(
+                row,
+                text=label,
+                font=("Helvetica", 14)
+            ).pack(side="left", padx=10, pady=5)
+            
+            ctk.CTkLabel(
+                row,
+                text=value,
+                font=("Helvetica", 14, "bold")
+            ).pack(side="right", padx=10, pady=5)
 
     def show_initial_setup(self):
         """Show initial setup window for new users"""
@@ -1530,15 +4480,15 @@ Please provide a comprehensive and detailed plan with clear formatting."""
                     self.show_error("Please fill in all fields")
                     return
                 
-                with open("user_profile.json", "w") as f:
-                    json.dump(profile, f)
+                self.profile_store.save(profile)
                 
                 self.food_log = self.load_food_log()
-                self.initialize_gemini()
                 self.workout_plan = self.load_workout_plan()
                 self.progress_data = self.load_progress_data()
                 self.setup_gui()
                 self.refresh_food_log()
+                self.initialize_gemini()
+                self.watch_profile()
                 
                 setup_window.destroy()
                 
@@ -0,0 +1,55 @@
+from python import ChatSession, CoachAnswerCache
+
+
+def ask(session, cache, question, model_answer):
+    """The ask_ai_coach flow without the UI: returns (answer, came from cache)"""
+    standalone = not session.in_conversation()
+    cached = cache.lookup(question)
+    if cached is not None:
+        answer, _ = cached
+        session.add_exchange(question, answer)
+        return answer, True
+    if standalone:
+        cache.put(question, model_answer)
+    session.add_exchange(question, model_answer)
+    return model_answer, False
+
+
+def test_repeated_question_hits_the_cache_after_a_restart(tmp_path):
+    session_path = str(tmp_path / "coach_session.json")
+    cache_path = str(tmp_path / "coach_answer_cache.json")
+    ask(ChatSession(path=session_path), CoachAnswerCache(path=cache_path),
+        "How much protein should I eat?", "About 1.6-2.2g per kg")
+
+    # Next launch: the session comes back non-empty
+    session = ChatSession(path=session_path)
+    assert not session.is_empty()
+    assert not session.in_conversation()
+    answer, cached = ask(session, CoachAnswerCache(path=cache_path), "how much protein should I eat", "model again")
+    assert cached and answer == "About 1.6-2.2g per kg"
+
+
+def test_follow_ups_are_not_cached(tmp_path):
+    session = ChatSession(path=str(tmp_path / "coach_session.json"))
+    cache = CoachAnswerCache(path=str(tmp_path / "coach_answer_cache.json"))
+    ask(session, cache, "what should I eat for breakfast to build muscle", "Eggs and oats")
+    assert session.in_conversation()
+    ask(session, cache, "and what about for dinner", "Salmon and rice")
+    assert list(cache._entries) == ["what should i eat for breakfast to build muscle"]
+
+
+def test_question_after_a_pause_is_standalone(tmp_path):
+    session = ChatSession(path=str(tmp_path / "coach_session.json"), followup_gap=60)
+    session.add_exchange("hi", "hello")
+    assert session.in_conversation()
+    for turn in session.turns:
+        turn['at'] -= 61
+    assert not session.in_conversation()
+
+
+def test_summary_only_session_is_not_a_conversation(tmp_path):
+    session = ChatSession(path=str(tmp_path / "coach_session.json"))
+    session.add_exchange("hi", "hello")
+    session.fold(list(session.turns), "User said hi")
+    assert not session.is_empty()
+    assert not session.in_conversation()
@@ -0,0 +1,63 @@
+from python import CoachAnswerCache
+
+
+def make_cache(tmp_path, *questions):
+    cache = CoachAnswerCache(path=str(tmp_path / "coach_answer_cache.json"))
+    for question in questions:
+        cache.put(question, f"answer to: {question}")
+    return cache
+
+
+def test_same_question_reworded_is_a_hit(tmp_path):
+    cache = make_cache(tmp_path, "How many calories should I eat to lose weight?")
+    answer, score = cache.lookup("how many calories should i eat to lose weight")
+    assert answer == "answer to: How many calories should I eat to lose weight?"
+    assert score >= cache.threshold
+
+
+def test_gain_does_not_match_lose(tmp_path):
+    cache = make_cache(tmp_path, "how many calories should I eat to lose weight")
+    assert cache.lookup("how many calories should I eat to gain weight") is None
+
+
+def test_different_numbers_do_not_match(tmp_path):
+    cache = make_cache(tmp_path, "Is 100g of protein a day too much")
+    assert cache.lookup("Is 300g of protein a day too much") is None
+    assert cache.lookup("Is 100g of protein a day too much?") is not None
+
+
+def test_negation_does_not_match(tmp_path):
+    cache = make_cache(tmp_path, "should I eat carbs before a workout")
+    assert cache.lookup("should I not eat carbs before a workout") is None
+
+
+def test_compatible_needs_shared_content_words():
+    assert CoachAnswerCache.compatible("best protein sources for vegans", "best protein sources for vegans")
+    assert not CoachAnswerCache.compatible("best protein sources for vegans", "best protein shake flavors")
+
+
+def test_misses_are_counted(tmp_path):
+    cache = make_cache(tmp_path, "how many calories should I eat to lose weight")
+    cache.lookup("how many calories should I eat to gain weight")
+    assert cache.stats["misses"] == 1
+    assert cache.stats["hits"] == 0
+
+
+def test_expired_answers_are_not_served(tmp_path):
+    cache = make_cache(tmp_path, "how much protein should I eat", "best time to do cardio")
+    for record in cache._entries.values():
+        record['created'] -= cache.max_age + 1
+    assert cache.lookup("how much protein should I eat") is None
+    assert cache.lookup("How much protein should I eat?") is None
+    # The lookup only dropped what it matched against, put sweeps the rest
+    assert "best time to do cardio" in cache._entries
+    cache.put("is creatine safe", "answer")
+    assert list(cache._entries) == ["is creatine safe"]
+
+
+def test_expired_answers_are_dropped_on_load(tmp_path):
+    cache = make_cache(tmp_path, "how much protein should I eat")
+    for record in cache._entries.values():
+        record['created'] -= cache.max_age + 1
+    cache.save()
+    assert not CoachAnswerCache(path=str(tmp_path / "coach_answer_cache.json"))._entries
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from python import EntryColumns, FoodEntry, FoodLogIndex
+
+
+def entry(**fields):
+    base = {'food': "egg", 'quantity': 100.0, 'meal': "Breakfast", 'notes': "", 'calories': 155,
+            'protein': 13, 'carbs': 1.1, 'fats': 11, 'date': "2024-01-01", 'id': "1",
+            'photo': {"thumb": "https://example.com/egg.jpg", "highres": None}}
+    base.update(fields)
+    return base
+
+
+def same(a, b):
+    # == treats 1 and 1.0 as equal, the JSON text doesn't
+    return a == b and json.dumps(a) == json.dumps(b)
+
+
+@pytest.mark.parametrize("original", [
+    entry(),
+    entry(quantity=100, calories=155.5),
+    entry(calories="n/a"),
+    entry(serving_size="100g"),
+    {'food': "legacy", 'calories': 90},
+    {k: v for k, v in entry().items() if k != 'photo'},
+    entry(photo={"highres": None, "thumb": "x"}),
+    entry(food="ünïcödé ☃", notes="line\nbreak"),
+    entry(fats=True),
+])
+def test_dict_round_trip(original):
+    fe = FoodEntry.from_dict(json.loads(json.dumps(original)), EntryColumns())
+    assert same(dict(fe), original)
+    assert list(fe) == list(original)
+    assert len(fe) == len(original)
+
+
+def test_photos_differing_in_order_or_type_are_not_merged():
+    columns = EntryColumns()
+    photos = [{"a": True, "b": None}, {"a": 1, "b": None}, {"b": None, "a": True}]
+    entries = [FoodEntry.from_dict(entry(id=str(i), photo=photo), columns) for i, photo in enumerate(photos)]
+    for fe, photo in zip(entries, photos):
+        assert same(fe['photo'], photo)
+        assert list(fe['photo']) == list(photo)
+
+
+def test_mapping_behaviour():
+    fe = FoodEntry.from_dict(entry(), EntryColumns())
+    fe['calories'] = 200.5
+    fe['extra'] = [1, 2]
+    assert fe['calories'] == 200.5 and isinstance(fe['calories'], float)
+    assert fe.get('missing', "default") == "default"
+    del fe['notes']
+    assert 'notes' not in fe
+    with pytest.raises(KeyError):
+        fe['notes']
+    fe.update(calories=3)
+    assert same(dict(fe), {**{k: v for k, v in entry().items() if k != 'notes'}, 'calories': 3, 'extra': [1, 2]})
+
+
+def test_index_stores_food_entries_and_detaches_removed_ones():
+    log = FoodLogIndex([entry(id="1"), entry(id="2", calories=45)])
+    first = log.get("1")
+    assert isinstance(first, FoodEntry)
+    assert log.totals_for_date("2024-01-01")['calories'] == 200
+
+    log.remove("1")
+    # Its row gets reused by the next entry, the removed object keeps its own values
+    log.add(entry(id="3", calories=999))
+    assert same(dict(first), entry(id="1"))
+    assert log.totals_for_date("2024-01-01")['calories'] == 45 + 999
+
+    log.update("2", {'calories': 50, 'meal': "Lunch"})
+    assert log.totals_for_meal("2024-01-01", "Lunch")['calories'] == 50
+    assert same(dict(log.get("2")), entry(id="2", calories=50, meal="Lunch"))
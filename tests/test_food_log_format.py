@@ -0,0 +1,170 @@
+import json
+import os
+import random
+
+import pytest
+
+from python import (BinaryLogFormat, EntryColumns, FOOD_LOG_FORMATS, FoodEntry, FoodLogIndex, FoodLogStore,
+                    JsonLogFormat, read_food_log_snapshot)
+
+
+def entry(entry_id="1", **fields):
+    base = {'food': "egg", 'quantity': 100.0, 'meal': "Breakfast", 'notes': "", 'calories': 155,
+            'protein': 13, 'carbs': 1.1, 'fats': 11, 'date': "2099-01-01", 'id': entry_id,
+            'photo': {"thumb": "https://example.com/egg.jpg", "highres": None}}
+    base.update(fields)
+    return base
+
+
+def same(a, b):
+    # == treats 1 and 1.0 as equal, the JSON text doesn't
+    return a == b and json.dumps(a) == json.dumps(b)
+
+
+def round_trip(entries):
+    fmt = BinaryLogFormat()
+    return fmt.decode(fmt.encode(entries))
+
+
+def test_empty_log():
+    assert round_trip([]) == []
+
+
+def test_columnar_entries():
+    entries = [entry(str(i), food=f"food {i % 3}", date=f"2099-01-{i % 28 + 1:02d}") for i in range(50)]
+    assert same(round_trip(entries), entries)
+
+
+def test_mixed_int_and_float_columns():
+    entries = [entry("1", quantity=100, calories=155.0), entry("2", quantity=50.5, calories=80), entry("3", carbs=0)]
+    decoded = round_trip(entries)
+    assert same(decoded, entries)
+    assert [type(e['quantity']) for e in decoded] == [int, float, float]
+
+
+def test_raw_entries_keep_their_position():
+    entries = [
+        {'food': "legacy", 'calories': 90},
+        entry("1"),
+        {k: v for k, v in entry("2").items() if k != 'photo'},
+        entry("3", calories="n/a"),
+        entry("4", fats=2 ** 60),
+        entry("5", notes="nul\0inside"),
+        entry("6", serving_size="100g"),
+        ["not", "an", "entry"],
+        entry("7"),
+    ]
+    assert same(round_trip(entries), entries)
+
+
+def test_missing_photo_only():
+    entries = [{k: v for k, v in entry(str(i)).items() if k != 'photo'} for i in range(3)]
+    assert same(round_trip(entries), entries)
+
+
+def test_photos_are_not_merged_across_order_or_type():
+    entries = [entry("1", photo={"a": True, "b": None}), entry("2", photo={"a": 1, "b": None}),
+               entry("3", photo={"b": None, "a": True}), entry("4", photo=None), entry("5", photo={"a": [1]})]
+    decoded = round_trip(entries)
+    assert same(decoded, entries)
+    assert [list(e['photo'] or {}) for e in decoded] == [list(e['photo'] or {}) for e in entries]
+
+
+def test_food_entries_encode_like_dicts():
+    entries = [entry("1"), entry("2", quantity=3), {'food': "legacy"}]
+    columns = EntryColumns()
+    compact = [FoodEntry.from_dict(e, columns) for e in entries]
+    assert same(round_trip(compact), entries)
+
+
+def test_random_logs_round_trip():
+    rng = random.Random(1234)
+    values = [0, 1, -7, 2 ** 40, 0.5, -3.25, 1e300, "", "x", None, True, False]
+    for _ in range(200):
+        entries = []
+        for i in range(rng.randrange(0, 12)):
+            e = entry(str(i), food=rng.choice(["egg", "rice", "ü"]), quantity=rng.choice([100, 100.0, 2.5]))
+            for key in rng.sample(list(e), rng.randrange(0, 3)):
+                e[key] = rng.choice(values)
+            if rng.random() < 0.2:
+                del e[rng.choice(list(e))]
+            entries.append(e)
+        assert same(round_trip(entries), entries)
+
+
+def test_formats_are_sniffed(tmp_path):
+    entries = [entry("1"), {'food': "legacy"}]
+    for fmt in FOOD_LOG_FORMATS.values():
+        # Same file name for both, the content decides
+        path = str(tmp_path / "snapshot")
+        fmt.write(path, entries)
+        assert same(read_food_log_snapshot(path), entries)
+
+
+def test_unknown_version_is_rejected():
+    payload = bytearray(BinaryLogFormat().encode([entry()]))
+    payload[4] = 99
+    with pytest.raises(ValueError):
+        BinaryLogFormat().decode(bytes(payload))
+
+
+def test_migrates_legacy_json_with_journal(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("food_log.json", "w") as f:
+        json.dump([entry("1"), entry("2"), {'food': "no id yet", 'date': "2099-01-01"}], f)
+    with open("food_log.journal", "w") as f:
+        for record in ({"op": "add", "entry": entry("3", quantity=50)},
+                       {"op": "update", "id": "1", "fields": {'calories': 200, 'meal': "Lunch"}},
+                       {"op": "delete", "id": "2"}):
+            f.write(json.dumps(record) + "\n")
+        # Torn write from a crash
+        f.write('{"op": "add", "entry": {"fo')
+
+    store = FoodLogStore(snapshot_format="binary")
+    log = FoodLogIndex(store.load())
+    assert store.legacy_path == "food_log.json"
+    assert store.needs_compaction()
+    store.compact(log, background=False)
+
+    assert not os.path.exists("food_log.json")
+    assert os.path.exists("food_log.json.migrated")
+    assert read_food_log_snapshot("food_log.bin")[:1] == [entry("1", calories=200, meal="Lunch")]
+
+    reloaded = FoodLogStore(snapshot_format="binary")
+    entries = reloaded.load()
+    assert reloaded.legacy_path is None
+    assert not reloaded.needs_compaction()
+    assert same(entries, [dict(e) for e in log])
+    # Snapshot order, then the journal's add, with the legacy entry given an id on load
+    assert [e['food'] for e in entries] == ["egg", "no id yet", "egg"]
+    assert entries[0]['id'] == "1" and entries[2]['id'] == "3" and entries[1]['id']
+
+
+def test_failed_conversion_keeps_reading_the_legacy_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("food_log.json", "w") as f:
+        json.dump([entry("1")], f)
+    store = FoodLogStore(snapshot_format="binary")
+    store.load()
+
+    def fail(path, entries):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(store.format, "write", fail)
+        store.compact(store.load(), background=False)
+
+    assert os.path.exists("food_log.json")
+    retry = FoodLogStore(snapshot_format="binary")
+    assert same(retry.load(), [entry("1")])
+    assert retry.legacy_path == "food_log.json"
+
+
+def test_switching_back_to_json(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    BinaryLogFormat().write("food_log.bin", [entry("1")])
+    store = FoodLogStore(snapshot_format="json")
+    entries = store.load()
+    store.compact(entries, background=False)
+    assert os.path.exists("food_log.bin.migrated")
+    assert same(JsonLogFormat().decode(open("food_log.json", "rb").read()), [entry("1")])
@@ -0,0 +1,43 @@
+import os
+
+from python import FoodLogStore, PersistenceWorker
+
+
+def entry(entry_id, date="2099-01-01"):
+    return {'food': "egg", 'quantity': 100.0, 'meal': "Breakfast", 'notes': "", 'calories': 155,
+            'protein': 13, 'carbs': 1.1, 'fats': 11, 'date': date, 'id': entry_id, 'photo': {}}
+
+
+def test_call_runs_between_earlier_and_later_appends(tmp_path):
+    path = str(tmp_path / "lines")
+    seen = []
+    writer = PersistenceWorker(delay=60)
+    try:
+        writer.append_line(path, "before\n")
+        writer.call(lambda: seen.append(open(path).read()))
+        writer.append_line(path, "after\n")
+        writer.flush()
+    finally:
+        writer.close()
+    assert seen == ["before\n"]
+    assert open(path).read() == "before\nafter\n"
+
+
+def test_compact_does_not_flush_and_keeps_later_records(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    writer = PersistenceWorker(delay=60)
+    try:
+        store = FoodLogStore(writer=writer, snapshot_format="binary")
+        store.load()
+        store.record_add(entry("1"))
+        store.compact([entry("1")])
+        # Nothing touched the disk on the calling thread
+        assert writer.flushes == 0
+        assert not os.path.exists(store.journal_path)
+        # Logged after the snapshot was taken, so only the fresh journal has it
+        store.record_add(entry("2"))
+        writer.flush()
+    finally:
+        writer.close()
+    assert [e['id'] for e in FoodLogStore(snapshot_format="binary").load()] == ["1", "2"]
+    assert not os.path.exists(store.rotated_path)
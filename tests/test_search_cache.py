@@ -0,0 +1,30 @@
+from python import SearchCache
+
+
+def food(name):
+    return {"food_name": name}
+
+
+def test_prefix_results_are_filtered():
+    cache = SearchCache()
+    cache.put("chick", {"common": [food("chicken breast"), food("chickpeas")], "branded": []})
+    assert cache.get("chicken") == {"common": [food("chicken breast")], "branded": []}
+
+
+def test_truncated_prefix_is_not_reused():
+    cache = SearchCache()
+    cache.put("che", {"common": [food(f"cheddar {i}") for i in range(SearchCache.PAGE_SIZE)], "branded": []})
+    assert cache.get("cheddar") is None
+
+
+def test_short_prefix_is_not_reused():
+    cache = SearchCache()
+    cache.put("c", {"common": [food("cheese")], "branded": []})
+    assert cache.get("cheese") is None
+
+
+def test_exact_query_is_always_served():
+    cache = SearchCache()
+    results = {"common": [food(f"apple {i}") for i in range(SearchCache.PAGE_SIZE)], "branded": []}
+    cache.put("Apple", results)
+    assert cache.get("apple ") is results